@@ -8,16 +8,18 @@
 
 import json
 import dateutil.parser
-import babel
 from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
 import logging
-from logging import Formatter, FileHandler
+import logs
 from flask_wtf import Form
 from forms import *
+from formatting import DateTimeFormatter
+from fragments import FragmentCache
 from flask_migrate import Migrate
+from fsnd_shared import db_bootstrap, request_metrics
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -28,36 +30,16 @@ moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+db_bootstrap.instrument(app, db)
+request_metrics.instrument(app, db)
 from models import *
+from queries import list_shows, list_venue_areas, venue_shows, artist_shows
+import search
 
 #----------------------------------------------------------------------------#
 # Helper Functions.
 #----------------------------------------------------------------------------#
 
-# Calculate the upcoming and past shows for venue and artists
-def past_upcoming_shows(model_shows, model):
-  previous = []
-  upcoming = []
-  for show in model_shows:
-    show_time = datetime.strptime(show.start_time, '%Y-%m-%d %H:%M:%S')
-    if show_time < datetime.now():
-      previous.append(show)
-    else:
-      upcoming.append(show)
-  return previous, upcoming
-
-# Get shows for a venue or artist
-def get_shows_info(shows, model):
-  for show in shows:
-    if model == "venue":
-      artist = Artist.query.get(show.artist_id)
-      show.artist_name = artist.name
-      show.artist_image_link = artist.image_link
-    elif model == "artist":
-      venue = Venue.query.get(show.venue_id)
-      show.venue_name = venue.name
-      show.venue_image_link = venue.image_link
-
 # For WTF BoolienField Form and saving to DB
 def boolean_field(bool_field):
   if bool_field == 'y':
@@ -69,16 +51,20 @@ def boolean_field(bool_field):
 # Filters.
 #----------------------------------------------------------------------------#
 
+# patterns are compiled once and recent results memoized, see formatting.py
+datetime_formatter = DateTimeFormatter()
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  return datetime_formatter.format(value, format)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+# rendered blocks are cached per dependency version, write handlers touch()
+# what they changed, see fragments.py
+fragment_cache = FragmentCache()
+app.jinja_env.globals['fragment'] = fragment_cache.fragment
+app.extensions['request_metrics'].register_stats('fragment_cache', fragment_cache.stats)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -92,54 +78,24 @@ def index():
 
 @app.route('/venues')
 def venues():
-  venues = Venue.query.all()
-  data = []
-  areas = []
-  result = []
-
-  # get distinct groupings of city, state
-  for venue in venues:
-    if (venue.city, venue.state) not in areas:
-      areas.append((venue.city, venue.state))
-  
-  # query for venues in areas, append results to data object
-  for area in areas:
-    venues = Venue.query.filter_by(city=area[0], state=area[1]).all()
-    result = {
-      "city": area[0], 
-      "state": area[1],
-      "venues": []
-    }
-    for venue in venues:
-      result['venues'].append({
-        "id": venue.id,
-        "name": venue.name
-      })
-    data.append(result)
-
-  return render_template('pages/venues.html', areas=data);
+  # the area groups are a cached fragment, queried only on a miss
+  return render_template('pages/venues.html', load_areas=list_venue_areas)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   # search on artists with partial string search. Ensure it is case-insensitive.
-  search = request.form.get('search_term', '').lower()
-  response = Venue.query.filter(func.lower(Venue.name).like('%' + search + '%')).all()
-  return render_template('pages/search_venues.html', results=response, search_term=search)
+  search_term = request.form.get('search_term', '')
+  page = search.search(Venue, search_term)
+  return render_template('pages/search_venues.html', results=page.results, count=page.count, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   data = Venue.query.get(venue_id)
-  venue_shows = Show.query.join(Venue)
-  past, upcoming = past_upcoming_shows(venue_shows, "venue")
-  data.past_shows = past
-  data.past_shows_count = len(past)
-  data.upcoming_shows = upcoming
-  data.upcoming_shows_count = len(upcoming)
-  get_shows_info(data.past_shows, "venue")
-  get_shows_info(data.upcoming_shows, "venue")
+  if data is None:
+    abort(404)
 
-  return render_template('pages/show_venue.html', venue=data)
+  return render_template('pages/show_venue.html', venue=data, load_shows=lambda: venue_shows(data))
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -163,6 +119,7 @@ def create_venue_submission():
       venue = Venue(name=data['name'], city=data['city'], state=data['state'], address=data['address'], phone=data['phone'], genres=data['genres'], image_link=data['image_link'], facebook_link=data['facebook_link'], website=data['website'])
     db.session.add(venue)
     db.session.commit()
+    fragment_cache.touch('venue', venue.id)
 
     # on successful db insert, flash success
     flash('Venue ' + venue.name + ' was successfully listed!')
@@ -177,7 +134,7 @@ def create_venue_submission():
   finally:
     db.session.close()
 
-  return render_template('pages/home.html')
+  return redirect(url_for('index'))
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
@@ -186,6 +143,8 @@ def delete_venue(venue_id):
     venue = Venue.query.get(venue_id)
     db.session.delete(venue)
     db.session.commit()
+    fragment_cache.touch('venue', int(venue_id))
+    fragment_cache.touch('show')
   except:
     db.session.rollback()
     error = True
@@ -201,33 +160,26 @@ def delete_venue(venue_id):
 @app.route('/artists')
 def artists():
   # replace with real data returned from querying the database
-  result = Artist.query.all()
-  data = []
-  for artist in result:
-    data.append({"id": artist.id, "name": artist.name})
+  # the artist cards are a cached fragment, queried only on a miss
+  def load_artists():
+    return db.session.query(Artist.id, Artist.name).order_by(Artist.id).all()
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', load_artists=load_artists)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   # search on artists with partial string search. Ensure it is case-insensitive.
-  search = request.form.get('search_term', '').lower()
-  response = Artist.query.filter(func.lower(Artist.name).like('%' + search + '%')).all()
-  return render_template('pages/search_artists.html', results=response, search_term=search)
+  search_term = request.form.get('search_term', '')
+  page = search.search(Artist, search_term)
+  return render_template('pages/search_artists.html', results=page.results, count=page.count, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   data = Artist.query.get(artist_id)
-  artist_shows = Show.query.join(Artist)
-  past, upcoming = past_upcoming_shows(artist_shows, "artist")
-  data.past_shows = past
-  data.past_shows_count = len(past)
-  data.upcoming_shows = upcoming
-  data.upcoming_shows_count = len(upcoming)
-  get_shows_info(data.past_shows, "artist")
-  get_shows_info(data.upcoming_shows, "artist")
-  return render_template('pages/show_artist.html', artist=data)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_artist.html', artist=data, load_shows=lambda: artist_shows(data))
 
 #  Update
 #  ----------------------------------------------------------------
@@ -254,6 +206,7 @@ def edit_artist_submission(artist_id):
     artist.seeking_venue = result.seeking_venue
     artist.seeking_description = result.seeking_description
     db.session.commit()
+    fragment_cache.touch('artist', artist_id)
     flash('Artist ' + artist.name + ' was successfully updated!')
   except:
     db.session.rollback()
@@ -287,6 +240,7 @@ def edit_venue_submission(venue_id):
     venue.seeking_talent = result.seeking_talent
     venue.seeking_description = result.seeking_description
     db.session.commit()
+    fragment_cache.touch('venue', venue_id)
     flash('Venue ' + venue.name + ' was successfully updated!')
   except:
     db.session.rollback()
@@ -316,6 +270,7 @@ def create_artist_submission():
       artist = Artist(name=data['name'], city=data['city'], state=data['state'], phone=data['phone'], genres=data['genres'], image_link=data['image_link'], facebook_link=data['facebook_link'], website=data['website'])
     db.session.add(artist)
     db.session.commit()
+    fragment_cache.touch('artist', artist.id)
 
     # on successful db insert, flash success
     flash('Artist ' + artist.name + ' was successfully listed!')
@@ -329,7 +284,7 @@ def create_artist_submission():
   finally:
     db.session.close()
 
-  return render_template('pages/home.html')
+  return redirect(url_for('index'))
 
 
 #  Shows
@@ -337,22 +292,17 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  result = Show.query.all()
-  data = []
-  for show in result:
-    venue = Venue.query.get(show.venue_id)
-    artist = Artist.query.get(show.artist_id)
-    data.append({
-      "venue_id": show.venue_id, 
-      "venue_name": venue.name,
-      "artist_id": show.artist_id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": show.start_time
-    })
-
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one page per keyset cursor
+  after = None
+  after_id = request.args.get('after_id', type=int)
+  after_time = request.args.get('after_time')
+  if after_id is not None and after_time:
+    try:
+      after = (dateutil.parser.parse(after_time), after_id)
+    except ValueError:
+      abort(400)
+  # each page of shows is a cached fragment, queried only on a miss
+  return render_template('pages/shows.html', page_key=after, load_shows=lambda: list_shows(after=after))
 
 @app.route('/shows/create')
 def create_shows():
@@ -365,15 +315,20 @@ def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # insert form data as a new Show record in the db, instead
   try:
-    data = request.form.to_dict()
-    show = Show(artist_id=data['artist_id'], venue_id=data['venue_id'], start_time=data['start_time'])
+    form = ShowForm(request.form)
+    if form.start_time.data is None:
+      raise ValueError('invalid start_time')
+    show = Show(artist_id=form.artist_id.data, venue_id=form.venue_id.data, start_time=form.start_time.data)
     db.session.add(show)
     db.session.commit()
+    fragment_cache.touch('show')
+    fragment_cache.touch('venue', show.venue_id)
+    fragment_cache.touch('artist', show.artist_id)
 
     # on successful db insert, flash success
     flash('Show was successfully listed!')
 
-  except():
+  except:
     # on unsuccessful db insert, flash an error instead.
     # e.g., flash('An error occurred. Show could not be listed.')
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
@@ -382,7 +337,7 @@ def create_show_submission():
 
   finally:
     db.session.close()
-  return render_template('pages/home.html')
+  return redirect(url_for('index'))
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -393,14 +348,11 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+# log records are queued and written by a background thread, rotated,
+# as JSON with request ids and timings, see logs.py
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    queued_logging = logs.setup(app)
+    app.extensions['request_metrics'].register_stats('logging', queued_logging.stats)
     app.logger.info('errors')
 
 #----------------------------------------------------------------------------#
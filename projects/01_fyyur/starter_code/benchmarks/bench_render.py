@@ -0,0 +1,79 @@
+# Render benchmark for a 10k-show /shows page.
+#
+# Renders templates/pages/shows.html with N synthetic show rows (no
+# database involved) using the old per-call dateutil + babel filter and
+# the compiled, memoized formatting.DateTimeFormatter, cold and warm.
+# The fragment cache is cleared before every pass so each one renders the
+# page body; the last line shows a pass served from the cache.
+#
+# usage (from starter_code/): python benchmarks/bench_render.py [shows] [passes]
+
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+from app import app, fragment_cache
+from formatting import DateTimeFormatter
+
+ShowRow = namedtuple('ShowRow', 'venue_id venue_name artist_id artist_name artist_image_link start_time')
+
+
+def legacy_format_datetime(value, format='medium'):
+  if isinstance(value, str):
+    date = dateutil.parser.parse(value)
+  else:
+    date = value
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def rows(n):
+  start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+  return [ShowRow(i % 50, 'Venue %d' % (i % 50), i % 70, 'Artist %d' % (i % 70),
+                  'https://example.com/%d.jpg' % (i % 70), start + timedelta(hours=i))
+          for i in range(n)]
+
+
+def render(shows, passes, cached=False):
+  started = time.perf_counter()
+  with app.test_request_context('/shows'):
+    for _ in range(passes):
+      if not cached:
+        fragment_cache.clear()
+      render_template('pages/shows.html', page_key=None, load_shows=lambda: (shows, None))
+  return (time.perf_counter() - started) / passes * 1000
+
+
+def main(n, passes):
+  shows = rows(n)
+  filters = app.jinja_env.filters
+  print('%d shows, mean of %d renders' % (n, passes))
+
+  filters['datetime'] = legacy_format_datetime
+  print('%-26s %10.1f ms' % ('dateutil + babel', render(shows, passes)))
+
+  formatter = DateTimeFormatter()
+  filters['datetime'] = formatter.format
+  print('%-26s %10.1f ms' % ('compiled, cold memo', render(shows, 1)))
+  print('%-26s %10.1f ms' % ('compiled, warm memo', render(shows, passes)))
+
+  formatter.memo_size = 0
+  formatter.clear()
+  print('%-26s %10.1f ms' % ('compiled, no memo', render(shows, passes)))
+  print('%-26s %10.1f ms' % ('fragment cache hit', render(shows, passes, cached=True)))
+
+
+if __name__ == '__main__':
+  args = [int(arg) for arg in sys.argv[1:]]
+  main(*(args + [10000, 5][len(args):]))
@@ -0,0 +1,67 @@
+# Benchmark for the /shows listing.
+#
+# Seeds N shows (inside a transaction that is rolled back at the end) and
+# compares the old per-show .get() loop with queries.list_shows, reporting
+# the number of SQL statements and wall time at each size.
+#
+# usage (from starter_code/): python benchmarks/bench_shows.py 1000 5000 20000
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import Venue, Artist, Show
+from queries import QueryCounter, list_shows
+
+
+def seed(n_shows, n_venues=50, n_artists=50):
+  venues = [Venue(name='Bench Venue %d' % i, city='City', state='CA') for i in range(n_venues)]
+  artists = [Artist(name='Bench Artist %d' % i, city='City', state='CA') for i in range(n_artists)]
+  db.session.add_all(venues + artists)
+  db.session.flush()
+  start = datetime(2020, 1, 1)
+  db.session.bulk_insert_mappings(Show, [{
+    'venue_id': venues[i % n_venues].id,
+    'artist_id': artists[i % n_artists].id,
+    'start_time': start + timedelta(hours=i)
+  } for i in range(n_shows)])
+  db.session.flush()
+
+
+def legacy_shows():
+  data = []
+  for show in Show.query.all():
+    venue = Venue.query.get(show.venue_id)
+    artist = Artist.query.get(show.artist_id)
+    data.append((show.venue_id, venue.name, show.artist_id, artist.name, artist.image_link, show.start_time))
+  return data
+
+
+def measure(fn):
+  db.session.expire_all()
+  with QueryCounter(db.engine) as counter:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+  return counter.count, elapsed
+
+
+def main(sizes):
+  print('%8s  %14s %10s  %14s %10s' % ('shows', 'legacy queries', 'legacy s', 'joined queries', 'joined s'))
+  for n in sizes:
+    with app.app_context():
+      try:
+        seed(n)
+        legacy = measure(legacy_shows)
+        joined = measure(lambda: list_shows(limit=None))
+        print('%8d  %14d %10.3f  %14d %10.3f' % (n, legacy[0], legacy[1], joined[0], joined[1]))
+      finally:
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+  main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000])
@@ -0,0 +1,94 @@
+# Before/after EXPLAIN benchmark for the Show.start_time migration.
+#
+# Builds two copies of the show table in a scratch `bench` schema, seeded
+# server-side with generate_series:
+#   before -- start_time varchar, no indexes (revision ab8594fee154)
+#   after  -- start_time timestamptz with the indexes of 5dd6e0220283
+# and runs EXPLAIN (ANALYZE, BUFFERS) for the queries behind the venue,
+# artist and /shows pages. The scratch schema is dropped afterwards.
+#
+# usage (from starter_code/): python benchmarks/explain_shows.py [rows]
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app import app, db
+
+N_VENUES = 2000
+N_ARTISTS = 5000
+
+SETUP = """
+DROP SCHEMA IF EXISTS bench CASCADE;
+CREATE SCHEMA bench;
+CREATE TABLE bench.show_before (
+  id serial PRIMARY KEY,
+  start_time varchar(120),
+  artist_id integer,
+  venue_id integer
+);
+INSERT INTO bench.show_before (start_time, artist_id, venue_id)
+SELECT to_char(now() - interval '2 years' + g * interval '1 minute', 'YYYY-MM-DD HH24:MI:SS'),
+       1 + g % {artists}, 1 + g % {venues}
+FROM generate_series(1, {rows}) AS g;
+CREATE TABLE bench.show_after AS
+SELECT id, start_time::timestamptz AS start_time, artist_id, venue_id FROM bench.show_before;
+ALTER TABLE bench.show_after ADD PRIMARY KEY (id);
+CREATE INDEX ON bench.show_after (venue_id, start_time);
+CREATE INDEX ON bench.show_after (artist_id, start_time);
+CREATE INDEX ON bench.show_after (start_time, id);
+ANALYZE bench.show_before;
+ANALYZE bench.show_after;
+"""
+
+QUERIES = {
+  'venue upcoming': {
+    'before': "SELECT * FROM bench.show_before WHERE venue_id = 42 "
+              "AND start_time::timestamp >= now() ORDER BY start_time::timestamp",
+    'after': "SELECT * FROM bench.show_after WHERE venue_id = 42 "
+             "AND start_time >= now() ORDER BY start_time",
+  },
+  'artist past': {
+    'before': "SELECT * FROM bench.show_before WHERE artist_id = 42 "
+              "AND start_time::timestamp < now() ORDER BY start_time::timestamp DESC",
+    'after': "SELECT * FROM bench.show_after WHERE artist_id = 42 "
+             "AND start_time < now() ORDER BY start_time DESC",
+  },
+  'shows page': {
+    'before': "SELECT * FROM bench.show_before WHERE (start_time, id) > ('2021-06-01 00:00:00', 0) "
+              "ORDER BY start_time, id LIMIT 101",
+    'after': "SELECT * FROM bench.show_after WHERE (start_time, id) > ('2021-06-01 00:00:00+00', 0) "
+             "ORDER BY start_time, id LIMIT 101",
+  },
+}
+
+
+def explain(conn, sql):
+  plan = conn.execute(text('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql)).scalar()
+  if isinstance(plan, str):
+    plan = json.loads(plan)
+  top = plan[0]
+  return top['Execution Time'], top['Plan']['Node Type']
+
+
+def main(rows):
+  with app.app_context():
+    with db.engine.connect() as conn:
+      conn.execute(text(SETUP.format(rows=rows, venues=N_VENUES, artists=N_ARTISTS)))
+      try:
+        print('%d shows' % rows)
+        print('%-16s %12s %-22s %12s %-22s' % ('query', 'before ms', 'before plan', 'after ms', 'after plan'))
+        for name, variants in QUERIES.items():
+          before_ms, before_node = explain(conn, variants['before'])
+          after_ms, after_node = explain(conn, variants['after'])
+          print('%-16s %12.2f %-22s %12.2f %-22s' % (name, before_ms, before_node, after_ms, after_node))
+      finally:
+        conn.execute(text('DROP SCHEMA bench CASCADE'))
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
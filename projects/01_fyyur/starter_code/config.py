@@ -7,5 +7,9 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://thomaskeyes@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://thomaskeyes@localhost:5432/fyyur')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Pool sizing, pre-ping, recycle and statement timeout come from DB_* env vars.
+from fsnd_shared import db_bootstrap
+SQLALCHEMY_ENGINE_OPTIONS = db_bootstrap.engine_options(SQLALCHEMY_DATABASE_URI)
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Date formatting for templates.
+#
+# babel.dates.format_datetime re-parses its locale and walks the locale data
+# for every field on every call, and dateutil's parser is slow for the ISO
+# strings the database hands back. The listing pages format one timestamp
+# per row, so DateTimeFormatter compiles each (locale, format) pattern once,
+# tries datetime.fromisoformat before dateutil, and remembers recent results.
+#----------------------------------------------------------------------------#
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import LC_TIME, DateTimeFormat, parse_pattern, tokenize_pattern
+
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+MEMO_SIZE = 10000
+
+# the part of a datetime each babel field depends on; a field's text is
+# computed by babel once per key and looked up afterwards. Patterns using
+# any other field (time zones, weeks, ...) go through babel every time.
+FIELD_KEYS = {
+  'y': lambda date: date.year,
+  'M': lambda date: date.month,
+  'L': lambda date: date.month,
+  'd': lambda date: date.day,
+  'E': lambda date: date.weekday(),
+  'e': lambda date: date.weekday(),
+  'c': lambda date: date.weekday(),
+  'a': lambda date: date.hour >= 12,
+  'h': lambda date: date.hour,
+  'H': lambda date: date.hour,
+  'K': lambda date: date.hour,
+  'k': lambda date: date.hour,
+  'm': lambda date: date.minute,
+  's': lambda date: date.second,
+}
+
+
+def parse_datetime(value):
+  if isinstance(value, datetime):
+    return value
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    return dateutil.parser.parse(value)
+
+
+class CompiledPattern(object):
+  def __init__(self, pattern, locale):
+    self.locale = locale
+    self.pattern = parse_pattern(pattern)
+    self.parts = []
+    for kind, value in tokenize_pattern(pattern):
+      if kind == 'chars':
+        self.parts.append(value)
+        continue
+      char, num = value
+      if char not in FIELD_KEYS:
+        self.parts = None
+        break
+      self.parts.append((char * num, FIELD_KEYS[char], {}))
+
+  def apply(self, date):
+    if self.parts is None:
+      return self.pattern.apply(date, self.locale)
+    fields = None
+    out = []
+    for part in self.parts:
+      if isinstance(part, str):
+        out.append(part)
+        continue
+      name, key, texts = part
+      value = key(date)
+      text = texts.get(value)
+      if text is None:
+        if fields is None:
+          fields = DateTimeFormat(date, self.locale)
+        text = texts[value] = fields[name]
+      out.append(text)
+    return ''.join(out)
+
+
+class DateTimeFormatter(object):
+  def __init__(self, locale=LC_TIME, memo_size=MEMO_SIZE):
+    self.locale = locale
+    self.memo_size = memo_size
+    self._patterns = {}
+    self._memo = OrderedDict()
+    self._lock = threading.Lock()
+
+  # CompiledPattern for a named format or a raw babel pattern
+  def compiled(self, format, locale=None):
+    key = (locale or self.locale, format)
+    compiled = self._patterns.get(key)
+    if compiled is None:
+      pattern = DATETIME_FORMATS.get(format, format)
+      compiled = CompiledPattern(pattern, Locale.parse(key[0]))
+      self._patterns[key] = compiled
+    return compiled
+
+  def format(self, value, format='medium', locale=None):
+    # aware datetimes compare equal across time zones, keep the zone apart
+    key = (value, getattr(value, 'tzinfo', None), format, locale)
+    with self._lock:
+      formatted = self._memo.get(key)
+      if formatted is not None:
+        self._memo.move_to_end(key)
+        return formatted
+
+    date = parse_datetime(value)
+    if date.tzinfo is None:
+      # same as babel: naive datetimes are taken to be UTC
+      date = date.replace(tzinfo=timezone.utc)
+    formatted = self.compiled(format, locale).apply(date)
+
+    with self._lock:
+      self._memo[key] = formatted
+      if len(self._memo) > self.memo_size:
+        self._memo.popitem(last=False)
+    return formatted
+
+  def clear(self):
+    with self._lock:
+      self._memo.clear()
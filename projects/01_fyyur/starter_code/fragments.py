@@ -0,0 +1,116 @@
+#----------------------------------------------------------------------------#
+# Rendered fragment cache.
+#
+# Templates wrap expensive blocks in
+#
+#   {% call fragment('venue-shows', ('venue', venue.id), 'artist') %}
+#     ...
+#   {% endcall %}
+#
+# and the block is rendered only when no entry exists for the current
+# versions of its dependencies. A dependency is an entity kind ('artist')
+# or a single entity (('venue', 3)). Write handlers call touch(kind, id),
+# which bumps that entity and its kind, so stale entries are never looked
+# up again and simply age out of the LRU.
+#
+# Versions live in this process. Entries also expire after a TTL, which
+# bounds staleness across workers and for time-dependent content such as
+# upcoming/past show splits.
+#----------------------------------------------------------------------------#
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 16 * 1024 * 1024))
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+
+def dependency(dep):
+  if isinstance(dep, tuple):
+    return dep
+  return (dep, None)
+
+
+class FragmentCache(object):
+  # max_size is the total length of the cached fragments, in characters
+  def __init__(self, max_size=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entries = OrderedDict()
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  def touch(self, kind, id=None):
+    with self._lock:
+      for key in ((kind, id), (kind, None)) if id is not None else ((kind, None),):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+  def key(self, name, deps):
+    deps = [dependency(dep) for dep in deps]
+    return (name,) + tuple((dep, self._versions.get(dep, 0)) for dep in deps)
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      if entry[0] < time.monotonic():
+        self._discard(key)
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[1]
+
+  def set(self, key, html):
+    if len(html) > self.max_size:
+      return
+    with self._lock:
+      if key in self._entries:
+        self._discard(key)
+      self._entries[key] = (time.monotonic() + self.ttl, html)
+      self.size += len(html)
+      while self.size > self.max_size:
+        self._discard(next(iter(self._entries)))
+        self.evictions += 1
+
+  def _discard(self, key):
+    _, html = self._entries.pop(key)
+    self.size -= len(html)
+
+  def render(self, name, deps, render):
+    key = self.key(name, deps)
+    html = self.get(key)
+    if html is None:
+      html = str(render())
+      self.set(key, html)
+    return html
+
+  # jinja global, used with {% call fragment(name, *deps) %}
+  def fragment(self, name, *deps, caller):
+    return Markup(self.render(name, deps, caller))
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.size = 0
+
+  def stats(self):
+    with self._lock:
+      return {
+        'entries': len(self._entries),
+        'size': self.size,
+        'max_size': self.max_size,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+      }
@@ -0,0 +1,225 @@
+#----------------------------------------------------------------------------#
+# Queued, structured logging.
+#
+# Log calls on the request thread only stamp the record with the request id
+# and timings and put it on a bounded in-memory queue. A QueueListener
+# thread formats the records and does the file writes and rotation, so a
+# slow or contended disk never holds up a response. When the queue is full
+# records are dropped and counted instead of blocking.
+#
+# Environment (all optional):
+#   LOG_FILE          file to write to (error.log)
+#   LOG_LEVEL         lowest level kept (INFO)
+#   LOG_FORMAT        json or text (json)
+#   LOG_ROTATE        size, time or none (size)
+#   LOG_MAX_BYTES     size rotation threshold (10 MB)
+#   LOG_ROTATE_WHEN   time rotation interval, see TimedRotatingFileHandler
+#                     (midnight)
+#   LOG_BACKUP_COUNT  rotated files kept (5)
+#   LOG_QUEUE_SIZE    records buffered before dropping (10000)
+#   LOG_SAMPLE        share of records below WARNING kept per logger, e.g.
+#                     'fyyur.access=0.1,werkzeug=0' (everything)
+#----------------------------------------------------------------------------#
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import (
+  QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+)
+
+from flask import g, has_request_context, request
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# record attributes copied into the JSON output when present
+CONTEXT_FIELDS = ('request_id', 'method', 'path', 'status', 'duration_ms', 'elapsed_ms')
+
+access_log = logging.getLogger('fyyur.access')
+
+
+def parse_rates(spec):
+  rates = {}
+  for item in filter(None, (part.strip() for part in spec.split(','))):
+    name, _, rate = item.partition('=')
+    rates[name.strip()] = float(rate)
+  return rates
+
+
+class JSONFormatter(logging.Formatter):
+  def format(self, record):
+    entry = {
+      'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+      'source': '%s:%d' % (record.pathname, record.lineno),
+    }
+    for field in CONTEXT_FIELDS:
+      value = getattr(record, field, None)
+      if value is not None:
+        entry[field] = value
+    if record.exc_info and not record.exc_text:
+      record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      entry['exception'] = record.exc_text
+    if record.stack_info:
+      entry['stack'] = self.formatStack(record.stack_info)
+    return json.dumps(entry, default=str)
+
+
+# stamps records with the current request, must run on the request thread
+class RequestContextFilter(logging.Filter):
+  def filter(self, record):
+    if has_request_context() and getattr(record, 'request_id', None) is None:
+      record.request_id = g.get('request_id')
+      record.method = request.method
+      record.path = request.path
+      started = g.get('request_started')
+      if started is not None:
+        record.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+    return True
+
+
+# keeps a share of the records below WARNING from noisy loggers; a rate set
+# for 'werkzeug' also applies to 'werkzeug.serving'
+class SamplingFilter(logging.Filter):
+  def __init__(self, rates, rand=random.random):
+    super().__init__()
+    self.rates = rates
+    self.rand = rand
+    self.sampled_out = 0
+
+  def rate(self, name):
+    while True:
+      if name in self.rates:
+        return self.rates[name]
+      if '.' not in name:
+        return 1.0
+      name = name.rpartition('.')[0]
+
+  def filter(self, record):
+    if record.levelno >= logging.WARNING or not self.rates:
+      return True
+    rate = self.rate(record.name)
+    if rate >= 1 or self.rand() < rate:
+      return True
+    self.sampled_out += 1
+    return False
+
+
+class DroppingQueueHandler(QueueHandler):
+  def __init__(self, queue):
+    super().__init__(queue)
+    self.dropped = 0
+
+  def prepare(self, record):
+    # the listener thread has no request and the args may change after
+    # the call returns, so resolve everything here but leave the
+    # formatting to the listener
+    record = copy.copy(record)
+    record.message = record.getMessage()
+    if record.exc_info:
+      record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+    record.msg = record.message
+    record.args = None
+    record.exc_info = None
+    return record
+
+  def enqueue(self, record):
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+
+
+def file_handler(path):
+  rotate = os.environ.get('LOG_ROTATE', 'size')
+  backups = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+  if rotate == 'size':
+    max_bytes = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+  if rotate == 'time':
+    when = os.environ.get('LOG_ROTATE_WHEN', 'midnight')
+    return TimedRotatingFileHandler(path, when=when, backupCount=backups, delay=True, utc=True)
+  if rotate == 'none':
+    return logging.FileHandler(path, delay=True)
+  raise ValueError('unknown LOG_ROTATE {!r}'.format(rotate))
+
+
+class QueuedLogging(object):
+  def __init__(self, handler, queue_size=10000, sample=None):
+    self.handler = handler
+    self.queue = queue.Queue(queue_size)
+    self.queue_handler = DroppingQueueHandler(self.queue)
+    self.sampling = SamplingFilter(sample or {})
+    self.queue_handler.addFilter(self.sampling)
+    self.queue_handler.addFilter(RequestContextFilter())
+    self.listener = QueueListener(self.queue, handler, respect_handler_level=True)
+    self.running = False
+
+  def start(self, logger):
+    logger.addHandler(self.queue_handler)
+    self.listener.start()
+    self.running = True
+    atexit.register(self.stop)
+
+  # drains whatever is still queued before returning
+  def stop(self):
+    if self.running:
+      self.running = False
+      self.listener.stop()
+      self.handler.close()
+
+  def stats(self):
+    return {
+      'queued': self.queue.qsize(),
+      'dropped': self.queue_handler.dropped,
+      'sampled_out': self.sampling.sampled_out,
+    }
+
+
+def before_request():
+  g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+  g.request_started = time.perf_counter()
+
+
+def after_request(response):
+  response.headers.setdefault('X-Request-ID', g.get('request_id', ''))
+  started = g.get('request_started')
+  if started is not None:
+    duration_ms = round((time.perf_counter() - started) * 1000, 3)
+    access_log.info(
+      '%s %s %s %.1fms', request.method, request.path, response.status_code, duration_ms,
+      extra={'status': response.status_code, 'duration_ms': duration_ms}
+    )
+  return response
+
+
+# routes every logger (app.logger, werkzeug, db.*) through the queue and
+# gives each request an id, echoed in the X-Request-ID response header
+def setup(app):
+  handler = file_handler(os.environ.get('LOG_FILE', 'error.log'))
+  if os.environ.get('LOG_FORMAT', 'json') == 'json':
+    handler.setFormatter(JSONFormatter())
+  else:
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+  pipeline = QueuedLogging(
+    handler,
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+    sample=parse_rates(os.environ.get('LOG_SAMPLE', ''))
+  )
+  root = logging.getLogger()
+  root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+  pipeline.start(root)
+  app.before_request(before_request)
+  app.after_request(after_request)
+  app.extensions['queued_logging'] = pipeline
+  return pipeline
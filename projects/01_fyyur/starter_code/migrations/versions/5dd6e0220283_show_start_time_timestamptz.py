@@ -0,0 +1,86 @@
+"""Show.start_time as timestamptz, show indexes
+
+Revision ID: 5dd6e0220283
+Revises: ab8594fee154
+Create Date: 2020-11-02 10:12:41.306117
+
+Converts "Show".start_time from varchar to timestamptz without holding a
+long table lock:
+
+  1. add a nullable start_time_ts column and a trigger that keeps it in
+     sync with writes still coming from the old code
+  2. backfill start_time_ts in committed batches
+  3. swap the columns in one short transaction
+  4. build the indexes CONCURRENTLY
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5dd6e0220283'
+down_revision = 'ab8594fee154'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+INDEXES = [
+    ('ix_show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_show_start_time_id', ['start_time', 'id']),
+]
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('start_time_ts', sa.DateTime(timezone=True), nullable=True))
+    op.execute("""
+        CREATE FUNCTION show_sync_start_time_ts() RETURNS trigger AS $$
+        BEGIN
+            NEW.start_time_ts := NEW.start_time::timestamptz;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER show_sync_start_time_ts
+        BEFORE INSERT OR UPDATE OF start_time ON "Show"
+        FOR EACH ROW EXECUTE PROCEDURE show_sync_start_time_ts()
+    """)
+
+    # each batch commits on its own so row locks are only held briefly
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            result = bind.execute(sa.text("""
+                UPDATE "Show" SET start_time_ts = start_time::timestamptz
+                WHERE id IN (
+                    SELECT id FROM "Show"
+                    WHERE start_time_ts IS NULL AND start_time IS NOT NULL
+                    LIMIT :batch_size
+                )
+            """), batch_size=BATCH_SIZE)
+            if result.rowcount == 0:
+                break
+
+    op.execute('DROP TRIGGER show_sync_start_time_ts ON "Show"')
+    op.execute('DROP FUNCTION show_sync_start_time_ts()')
+    op.drop_column('Show', 'start_time')
+    op.alter_column('Show', 'start_time_ts', new_column_name='start_time')
+
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'Show', columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.drop_index(name, table_name='Show', postgresql_concurrently=True)
+
+    op.alter_column(
+        'Show', 'start_time',
+        type_=sa.String(length=120),
+        postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')"
+    )
@@ -0,0 +1,70 @@
+"""Trigram search over venue and artist name, city and genres
+
+Revision ID: d37f3389ca61
+Revises: 5dd6e0220283
+Create Date: 2020-11-04 16:41:08.519774
+
+Adds a search_text column to "Venue" and "Artist", kept current by a
+trigger, holding the lowercased name, city, state and genres. A pg_trgm
+GIN index on it lets `search_text LIKE '%term%'` use an index scan instead
+of a sequential scan of the whole table.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd37f3389ca61'
+down_revision = '5dd6e0220283'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist']
+
+
+def search_text_sql(row):
+    return (
+        "lower(concat_ws(' ', {row}.name, {row}.city, {row}.state, "
+        "array_to_string({row}.genres, ' ')))"
+    ).format(row=row)
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("""
+        CREATE FUNCTION fyyur_search_text() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_text := {expression};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """.format(expression=search_text_sql('NEW')))
+
+    for table in TABLES:
+        op.add_column(table, sa.Column('search_text', sa.Text(), nullable=True))
+        op.execute("""
+            CREATE TRIGGER {name}_search_text
+            BEFORE INSERT OR UPDATE OF name, city, state, genres ON "{table}"
+            FOR EACH ROW EXECUTE PROCEDURE fyyur_search_text()
+        """.format(name=table.lower(), table=table))
+        op.execute('UPDATE "{table}" SET search_text = {expression}'.format(
+            table=table, expression=search_text_sql('"{}"'.format(table))))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(
+                'ix_{}_search_text_trgm'.format(table.lower()), table, ['search_text'],
+                postgresql_using='gin',
+                postgresql_ops={'search_text': 'gin_trgm_ops'},
+                postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index('ix_{}_search_text_trgm'.format(table.lower()), table_name=table)
+        op.execute('DROP TRIGGER {name}_search_text ON "{table}"'.format(
+            name=table.lower(), table=table))
+        op.drop_column(table, 'search_text')
+    op.execute('DROP FUNCTION fyyur_search_text()')
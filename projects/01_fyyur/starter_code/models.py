@@ -1,9 +1,14 @@
+from sqlalchemy import and_, event, func
+
 from app import db
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# text[] on Postgres; a JSON list elsewhere so the models also run on SQLite
+Genres = db.ARRAY(db.String(120)).with_variant(db.JSON(), 'sqlite')
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -13,14 +18,16 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(Genres)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
-    upcoming_shows = db.relationship("Show")
-    past_shows = db.relationship("Show")
+    # kept current by set_search_text below; migration d37f3389ca61 adds a
+    # trigger doing the same for rows written outside the ORM
+    search_text = db.deferred(db.Column(db.Text))
+    shows = db.relationship('Show', back_populates='venue')
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
@@ -30,19 +37,65 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(Genres)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
-    upcoming_shows = db.relationship("Show")
-    past_shows = db.relationship("Show")
+    # kept current by set_search_text below; migration d37f3389ca61 adds a
+    # trigger doing the same for rows written outside the ORM
+    search_text = db.deferred(db.Column(db.Text))
+    shows = db.relationship('Show', back_populates='artist')
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    # the composite indexes also serve the venue_id / artist_id foreign keys
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.String(120))
+    start_time = db.Column(db.DateTime(timezone=True))
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
+    artist = db.relationship('Artist', back_populates='shows')
+    venue = db.relationship('Venue', back_populates='shows')
+
+#----------------------------------------------------------------------------#
+# Past / upcoming show relationships.
+#
+# Read-only views of Venue.shows and Artist.shows split on the database
+# clock. They are plain SQL predicates, so they can be lazy loaded, eager
+# loaded with selectinload(), or used to filter with Query.with_parent().
+#----------------------------------------------------------------------------#
+
+def _show_views(owner, foreign_key):
+    upcoming = and_(foreign_key == owner.id, Show.start_time >= func.current_timestamp())
+    past = and_(foreign_key == owner.id, Show.start_time < func.current_timestamp())
+    owner.upcoming_shows = db.relationship(Show, primaryjoin=upcoming, viewonly=True, order_by=Show.start_time)
+    owner.past_shows = db.relationship(Show, primaryjoin=past, viewonly=True, order_by=Show.start_time.desc())
+
+_show_views(Venue, Show.venue_id)
+_show_views(Artist, Show.artist_id)
+
+#----------------------------------------------------------------------------#
+# Search text.
+#
+# Lowercased name, city, state and genres, the column search.py matches
+# against. Same value as the fyyur_search_text() trigger, so databases
+# built with db.create_all() are searchable too.
+#----------------------------------------------------------------------------#
+
+def search_text(target):
+    parts = [target.name, target.city, target.state] + list(target.genres or [])
+    return ' '.join(part for part in parts if part is not None).lower()
+
+def set_search_text(mapper, connection, target):
+    target.search_text = search_text(target)
+
+for model in (Venue, Artist):
+    event.listen(model, 'before_insert', set_search_text)
+    event.listen(model, 'before_update', set_search_text)
@@ -0,0 +1,137 @@
+from collections import namedtuple
+from itertools import groupby
+
+from sqlalchemy import and_, or_, event, func
+from sqlalchemy.orm import joinedload
+
+from app import db
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+SHOWS_PER_PAGE = 100
+AREA_BATCH_SIZE = 1000
+
+ShowPartition = namedtuple('ShowPartition', [
+  'past_shows', 'past_shows_count', 'upcoming_shows', 'upcoming_shows_count'
+])
+
+class QueryCounter(object):
+  """Counts the SQL statements run on engine inside a with block."""
+
+  def __init__(self, engine):
+    self.engine = engine
+    self.count = 0
+
+  def _count(self, *args):
+    self.count += 1
+
+  def __enter__(self):
+    event.listen(self.engine, 'before_cursor_execute', self._count)
+    return self
+
+  def __exit__(self, *exc):
+    event.remove(self.engine, 'before_cursor_execute', self._count)
+
+# List shows with their venue and artist in a single joined query.
+# Rows are plain named tuples (no ORM entities) ordered by (start_time, id),
+# so `after` -- the (start_time, id) of the last row seen -- is a keyset
+# cursor for the next page.
+def list_shows(limit=SHOWS_PER_PAGE, after=None):
+  query = db.session.query(
+    Show.id,
+    Show.start_time,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link')
+  ).join(Venue, Venue.id == Show.venue_id) \
+   .join(Artist, Artist.id == Show.artist_id) \
+   .order_by(Show.start_time, Show.id)
+
+  if after is not None:
+    after_time, after_id = after
+    query = query.filter(or_(
+      Show.start_time > after_time,
+      and_(Show.start_time == after_time, Show.id > after_id)
+    ))
+
+  if limit is None:
+    return query.all(), None
+
+  # fetch one extra row to know whether there is a next page
+  rows = query.limit(limit + 1).all()
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = (rows[-1].start_time, rows[-1].id)
+  return rows, next_cursor
+
+# Venues grouped by (city, state) for the /venues directory.
+# One ordered query selects only id, name, city and state, with each venue's
+# upcoming show count from an aggregate subquery; rows are grouped in a
+# single streaming pass.
+def list_venue_areas():
+  upcoming = db.session.query(
+    Show.venue_id,
+    func.count(Show.id).label('num_upcoming_shows')
+  ).filter(Show.start_time >= func.current_timestamp()) \
+   .group_by(Show.venue_id) \
+   .subquery()
+
+  rows = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    func.coalesce(upcoming.c.num_upcoming_shows, 0).label('num_upcoming_shows')
+  ).outerjoin(upcoming, upcoming.c.venue_id == Venue.id) \
+   .order_by(Venue.state, Venue.city, Venue.name, Venue.id) \
+   .yield_per(AREA_BATCH_SIZE)
+
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.num_upcoming_shows
+      } for venue in venues]
+    })
+  return areas
+
+# Past and upcoming shows of one venue, with the artist playing each show.
+def venue_shows(venue):
+  return partition_shows(venue, Venue.upcoming_shows, Venue.past_shows, Show.artist)
+
+# Past and upcoming shows of one artist, with the venue hosting each show.
+def artist_shows(artist):
+  return partition_shows(artist, Artist.upcoming_shows, Artist.past_shows, Show.venue)
+
+# Split an entity's shows into past and upcoming on the database clock.
+# Each half is one query through the filtered relationship, with the other
+# side of each show joined in, so a detail page costs the same number of
+# queries however many shows it lists. COUNT(*) OVER () rides along on every
+# row so the counts come from the database, not from the loaded lists.
+def partition_shows(parent, upcoming_shows, past_shows, other_side):
+  def load(relationship):
+    rows = Show.query.with_parent(parent, relationship) \
+      .options(joinedload(other_side)) \
+      .add_columns(func.count().over().label('total')) \
+      .order_by(*relationship.property.order_by) \
+      .all()
+    return [row.Show for row in rows], rows[0].total if rows else 0
+
+  past, past_count = load(past_shows)
+  upcoming, upcoming_count = load(upcoming_shows)
+  return ShowPartition(
+    past_shows=past,
+    past_shows_count=past_count,
+    upcoming_shows=upcoming,
+    upcoming_shows_count=upcoming_count
+  )
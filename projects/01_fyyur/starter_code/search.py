@@ -0,0 +1,104 @@
+import heapq
+from collections import namedtuple
+
+from sqlalchemy import case, func, text
+
+from app import db
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_LIMIT = 50
+
+SearchResult = namedtuple('SearchResult', ['id', 'name', 'city', 'state'])
+
+# the first `limit` results and how many matched in all
+SearchPage = namedtuple('SearchPage', ['results', 'count'])
+
+# Rows of a query carrying COUNT(*) OVER () as `total`; the window is
+# computed before LIMIT, so it counts every match.
+def counted_page(rows):
+  return SearchPage(rows, rows[0].total if rows else 0)
+
+def like_pattern(term):
+  escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return '%' + escaped + '%'
+
+# Postgres backend: substring match on search_text, served by its pg_trgm
+# GIN index (migration d37f3389ca61). Name matches rank above city/genre
+# matches, then by trigram similarity.
+class PostgresSearchBackend(object):
+  def search(self, model, term, limit=SEARCH_LIMIT):
+    pattern = like_pattern(term)
+    name_match = case([(func.lower(model.name).like(pattern, escape='\\'), 1)], else_=0)
+    rows = db.session.query(
+      model.id, model.name, model.city, model.state, func.count().over().label('total')
+    ).filter(model.search_text.like(pattern, escape='\\')) \
+     .order_by(
+       name_match.desc(),
+       func.similarity(func.lower(model.name), term).desc(),
+       model.name
+     ) \
+     .limit(limit) \
+     .all()
+    return counted_page(rows)
+
+# Backend for databases without pg_trgm (SQLite, a Postgres built with
+# db.create_all()): the same search_text match picks the candidates, which
+# are ranked in memory by the same rules.
+class InMemorySearchBackend(object):
+  def search(self, model, term, limit=SEARCH_LIMIT):
+    rows = db.session.query(model.id, model.name, model.city, model.state, model.genres) \
+      .filter(model.search_text.like(like_pattern(term), escape='\\'))
+    ranked = []
+    for row in rows:
+      score = self.score(row, term)
+      if score:
+        ranked.append((-score, (row.name or '').lower(), row.id, row))
+    return SearchPage([
+      SearchResult(row.id, row.name, row.city, row.state)
+      for _, _, _, row in heapq.nsmallest(limit, ranked)
+    ], len(ranked))
+
+  @staticmethod
+  def score(row, term):
+    name = (row.name or '').lower()
+    if term in name:
+      # exact and prefix matches first, as trigram similarity would
+      return 3 if name == term else 2 if name.startswith(term) else 1
+    other = ' '.join([row.city or '', row.state or ''] + list(row.genres or [])).lower()
+    return 0.5 if term in other else 0
+
+def has_pg_trgm():
+  if db.engine.dialect.name != 'postgresql':
+    return False
+  installed = db.session.execute(
+    text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+  ).scalar()
+  return bool(installed)
+
+_backend = None
+
+def get_search_backend():
+  global _backend
+  if _backend is None:
+    if has_pg_trgm():
+      _backend = PostgresSearchBackend()
+    else:
+      _backend = InMemorySearchBackend()
+  return _backend
+
+# Ranked search over name, city, state and genres; returns a SearchPage
+# of the best `limit` results and the number of matches.
+def search(model, term, limit=SEARCH_LIMIT):
+  term = (term or '').strip().lower()
+  if not term:
+    # an empty search lists everything, as the old LIKE '%%' did
+    rows = db.session.query(
+      model.id, model.name, model.city, model.state, func.count().over().label('total')
+    ).order_by(model.name) \
+     .limit(limit) \
+     .all()
+    return counted_page(rows)
+  return get_search_backend().search(model, term, limit)
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+# never run against the development database, the tables are dropped
+os.environ.setdefault('DATABASE_URL', 'postgresql://localhost:5432/fyyur_test')
+
+from app import app, db, fragment_cache
+import logs
+from models import Venue, Artist, Show
+from queries import QueryCounter
+import search
+
+
+class FyyurTestCase(unittest.TestCase):
+  """Detail pages take a fixed number of queries, whatever they list."""
+
+  def setUp(self):
+    self.client = app.test_client()
+    db.create_all()
+    fragment_cache.clear()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+
+  def seed(self, n_shows):
+    venue = Venue(name='Venue', city='San Francisco', state='CA', genres=['Jazz'])
+    artists = [Artist(name='Artist %d' % i, city='San Francisco', state='CA', genres=['Jazz']) for i in range(n_shows)]
+    now = datetime.now(timezone.utc)
+    shows = [
+      Show(venue=venue, artist=artist, start_time=now + timedelta(days=i - n_shows // 2, hours=12))
+      for i, artist in enumerate(artists)
+    ]
+    db.session.add_all([venue] + artists + shows)
+    db.session.commit()
+    ids = venue.id, artists[0].id
+    db.session.remove()
+    return ids
+
+  def count_queries(self, url):
+    fragment_cache.clear()
+    with QueryCounter(db.engine) as counter:
+      res = self.client.get(url)
+    self.assertEqual(res.status_code, 200)
+    return counter.count
+
+  def test_venue_page_query_count(self):
+    few = self.count_queries('/venues/%d' % self.seed(2)[0])
+    many = self.count_queries('/venues/%d' % self.seed(20)[0])
+    self.assertEqual(few, many)
+    self.assertEqual(many, 3)
+
+  def test_artist_page_query_count(self):
+    artist_id = self.seed(4)[1]
+    self.assertEqual(self.count_queries('/artists/%d' % artist_id), 3)
+
+  def test_venue_page_splits_past_and_upcoming(self):
+    venue_id = self.seed(4)[0]
+    res = self.client.get('/venues/%d' % venue_id)
+    self.assertIn(b'2 Upcoming Shows', res.data)
+    self.assertIn(b'2 Past Shows', res.data)
+
+  def test_cached_venue_page_takes_one_query(self):
+    venue_id = self.seed(4)[0]
+    self.client.get('/venues/%d' % venue_id)
+    with QueryCounter(db.engine) as counter:
+      self.client.get('/venues/%d' % venue_id)
+    self.assertEqual(counter.count, 1)
+
+  def test_metrics_record_page_queries(self):
+    venue_id = self.seed(4)[0]
+    self.client.get('/venues/%d' % venue_id)
+    page = app.extensions['request_metrics'].endpoints['show_venue']
+    queries, rendering = page.queries.sum, page.serialization.sum
+    fragment_cache.clear()
+    self.client.get('/venues/%d' % venue_id)
+    self.assertEqual(page.queries.sum - queries, 3)
+    self.assertGreater(page.serialization.sum, rendering)
+    app.config['METRICS_TOKEN'] = 'secret'
+    self.addCleanup(app.config.pop, 'METRICS_TOKEN')
+    res = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    self.assertEqual(res.status_code, 200)
+    self.assertIn(b'http_request_db_queries_count{endpoint="show_venue"}', res.data)
+    self.assertIn(b'fragment_cache_misses ', res.data)
+
+  def test_metrics_endpoint_needs_token(self):
+    self.assertEqual(self.client.get('/metrics').status_code, 404)
+    app.config['METRICS_TOKEN'] = 'secret'
+    self.addCleanup(app.config.pop, 'METRICS_TOKEN')
+    self.assertEqual(self.client.get('/metrics').status_code, 401)
+    res = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+    self.assertEqual(res.status_code, 401)
+
+  def test_metrics_flag_repeated_statement(self):
+    metrics = app.extensions['request_metrics']
+    venue_id = self.seed(1)[0]
+    metrics.n_plus_one, threshold = 3, metrics.n_plus_one
+    try:
+      with app.test_request_context('/n-plus-one'):
+        metrics.start()
+        for _ in range(3):
+          db.session.query(Venue).filter(Venue.id == venue_id).all()
+        with self.assertLogs('db.n_plus_one', 'WARNING'):
+          metrics.finish('n_plus_one', 'GET')
+    finally:
+      metrics.n_plus_one = threshold
+    self.assertEqual(metrics.endpoints['n_plus_one'].n_plus_one, 1)
+
+  def seed_search(self):
+    db.session.add_all([
+      Venue(name='Rock Bar', city='Austin', state='TX', genres=['Jazz', 'Blues']),
+      Venue(name='The Jazz Cellar', city='Austin', state='TX', genres=['Rock']),
+      Venue(name='Jazz Hall', city='Austin', state='TX', genres=['Rock']),
+      Venue(name='Jazz', city='Austin', state='TX', genres=['Rock']),
+      Venue(name='Folk House', city='Austin', state='TX', genres=['Folk']),
+    ])
+    db.session.commit()
+
+  def search_names(self, term):
+    return [result.name for result in search.search(Venue, term).results]
+
+  def test_search_ranks_name_matches_first(self):
+    self.seed_search()
+    self.assertEqual(
+      self.search_names('jazz'),
+      ['Jazz', 'Jazz Hall', 'The Jazz Cellar', 'Rock Bar']
+    )
+
+  def test_search_matches_partial_terms_in_any_case(self):
+    self.seed_search()
+    self.assertEqual(self.search_names('HAL'), ['Jazz Hall'])
+    self.assertEqual(self.search_names('lues'), ['Rock Bar'])
+    self.assertEqual(len(self.search_names('austin')), 5)
+    self.assertEqual(self.search_names('polka'), [])
+
+  def test_search_follows_edits(self):
+    self.seed_search()
+    venue = Venue.query.filter_by(name='Folk House').one()
+    venue.name = 'Polka House'
+    db.session.commit()
+    self.assertEqual(self.search_names('polka'), ['Polka House'])
+    self.assertEqual(self.search_names('folk house'), [])
+
+  def test_search_counts_every_match(self):
+    self.seed_search()
+    page = search.search(Venue, 'austin', limit=2)
+    self.assertEqual((len(page.results), page.count), (2, 5))
+    page = search.search(Venue, '', limit=2)
+    self.assertEqual((len(page.results), page.count), (2, 5))
+
+  def test_search_page(self):
+    self.seed_search()
+    res = self.client.post('/venues/search', data={'search_term': 'cellar'})
+    self.assertEqual(res.status_code, 200)
+    self.assertIn(b'The Jazz Cellar', res.data)
+    self.assertNotIn(b'Jazz Hall', res.data)
+    self.assertIn(b'"cellar": 1<', res.data)
+
+  def test_404_venue_not_found(self):
+    res = self.client.get('/venues/1000')
+    self.assertEqual(res.status_code, 404)
+
+
+class QueuedLoggingTestCase(unittest.TestCase):
+  """Records reach the file from the listener thread, as JSON lines."""
+
+  def setUp(self):
+    self.path = os.path.join(tempfile.mkdtemp(), 'test.log')
+    handler = logs.RotatingFileHandler(self.path, delay=True)
+    handler.setFormatter(logs.JSONFormatter())
+    self.pipeline = logs.QueuedLogging(handler, sample={'test.logs.noisy': 0})
+    self.logger = logging.getLogger('test.logs')
+    self.logger.setLevel(logging.INFO)
+    self.logger.propagate = False
+    self.pipeline.start(self.logger)
+    self.addCleanup(self.logger.removeHandler, self.pipeline.queue_handler)
+
+  def lines(self):
+    self.pipeline.stop()
+    with open(self.path) as log:
+      return [json.loads(line) for line in log]
+
+  def test_records_carry_request_id_and_timing(self):
+    with app.test_request_context('/venues', headers={'X-Request-ID': 'abc'}):
+      logs.before_request()
+      self.logger.info('listing %d venues', 3)
+    line, = self.lines()
+    self.assertEqual(line['message'], 'listing 3 venues')
+    self.assertEqual(line['request_id'], 'abc')
+    self.assertEqual(line['path'], '/venues')
+    self.assertIn('elapsed_ms', line)
+
+  def test_exceptions_are_formatted_before_queueing(self):
+    try:
+      raise ValueError('boom')
+    except ValueError:
+      self.logger.exception('failed')
+    line, = self.lines()
+    self.assertIn('ValueError: boom', line['exception'])
+
+  def test_sampling_keeps_warnings(self):
+    noisy = logging.getLogger('test.logs.noisy')
+    noisy.info('dropped')
+    noisy.warning('kept')
+    self.assertEqual([line['message'] for line in self.lines()], ['kept'])
+    self.assertEqual(self.pipeline.stats()['sampled_out'], 1)
+
+  def test_full_queue_drops_instead_of_blocking(self):
+    self.pipeline.stop()
+    self.pipeline.queue_handler.queue = queue.Queue(1)
+    self.logger.info('one')
+    self.logger.info('two')
+    self.assertEqual(self.pipeline.queue_handler.dropped, 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+  unittest.main()
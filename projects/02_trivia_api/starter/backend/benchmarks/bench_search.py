@@ -0,0 +1,153 @@
+"""Benchmark question search over a synthetic corpus.
+
+Offline, compares the old substring scan (what LIKE '%term%' does row by
+row) with flaskr.search.InvertedIndex, the in-process backend used when
+the database is not Postgres.
+
+With DATABASE_URL pointing at Postgres it benchmarks the production path
+instead: the corpus is seeded server-side with generate_series into a
+scratch `bench` schema (dropped afterwards) with the ix_questions_search
+GIN index, and PostgresQuestionSearch (to_tsquery, ts_rank_cd, one page)
+is timed against the old ILIKE '%term%' query and count.
+
+usage (from backend/): python benchmarks/bench_search.py [questions]
+       DATABASE_URL=postgresql://... python benchmarks/bench_search.py [questions]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, text
+
+from flaskr.search import CREATE_SEARCH_INDEX, InvertedIndex, PostgresQuestionSearch
+
+VOCABULARY_SIZE = 20000
+WORDS_PER_QUESTION = 12
+QUERIES = 200
+PER_PAGE = 10
+
+# the same corpus shape as corpus(), built by the database itself
+SETUP = """
+DROP SCHEMA IF EXISTS bench CASCADE;
+CREATE SCHEMA bench;
+CREATE TABLE bench.questions (
+    id serial PRIMARY KEY,
+    question varchar,
+    answer varchar,
+    category integer,
+    difficulty integer
+);
+INSERT INTO bench.questions (question, answer, category, difficulty)
+SELECT (SELECT string_agg('w' || lpad(floor(random() * {vocabulary})::int::text, 5, '0'), ' ')
+        FROM generate_series(1, {words}) WHERE g > 0),
+       'answer', 1 + g % 6, 1 + g % 5
+FROM generate_series(1, {rows}) AS g;
+"""
+
+
+def corpus(n, rng):
+    vocabulary = ['w%05d' % i for i in range(VOCABULARY_SIZE)]
+    for doc_id in range(1, n + 1):
+        yield doc_id, ' '.join(rng.choice(vocabulary) for _ in range(WORDS_PER_QUESTION))
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def timed(fn, terms):
+    samples = []
+    for term in terms:
+        started = time.perf_counter()
+        fn(term)
+        samples.append(time.perf_counter() - started)
+    return percentile(samples, 0.5) * 1000, percentile(samples, 0.95) * 1000
+
+
+def main_postgres(database_url, n):
+    from flaskr import create_app
+    from models import db, Question
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'options': '-c search_path=bench'}},
+        'DB_SCHEMA_MODE': 'fast',
+    })
+    rng = random.Random(42)
+    terms = ['w%05d' % rng.randrange(VOCABULARY_SIZE) for _ in range(QUERIES)]
+    engine = db.get_engine(app)
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(SETUP.format(rows=n, vocabulary=VOCABULARY_SIZE, words=WORDS_PER_QUESTION)))
+    seeded = time.perf_counter() - started
+
+    backend = PostgresQuestionSearch()
+
+    def full_text(term):
+        return backend.search(term, 1, PER_PAGE)
+
+    def ilike(term):
+        matches = Question.query.filter(Question.question.ilike('%{}%'.format(term)))
+        return matches.order_by(Question.id).limit(PER_PAGE).all(), \
+            matches.with_entities(func.count(Question.id)).scalar()
+
+    try:
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_SEARCH_INDEX))
+            conn.execute(text('ANALYZE bench.questions'))
+        build = time.perf_counter() - started
+        with app.app_context():
+            try:
+                # the scan is slow, a handful of queries is enough to see it
+                ilike_p50, ilike_p95 = timed(ilike, terms[:10])
+                fts_p50, fts_p95 = timed(full_text, terms)
+            finally:
+                # give the connection back, or the DROP below waits on it
+                db.session.remove()
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text('DROP SCHEMA bench CASCADE'))
+
+    print('%d questions, seeded in %.1fs, GIN index built in %.1fs' % (n, seeded, build))
+    print('%-16s %10s %10s' % ('query', 'p50 ms', 'p95 ms'))
+    print('%-16s %10.2f %10.2f' % ('ILIKE scan', ilike_p50, ilike_p95))
+    print('%-16s %10.2f %10.2f' % ('tsquery + GIN', fts_p50, fts_p95))
+
+
+def main(n):
+    database_url = os.environ.get('DATABASE_URL', '')
+    if database_url.startswith(('postgres://', 'postgresql')):
+        return main_postgres(database_url, n)
+
+    rng = random.Random(42)
+    documents = list(corpus(n, rng))
+    terms = ['w%05d' % rng.randrange(VOCABULARY_SIZE) for _ in range(QUERIES)]
+
+    started = time.perf_counter()
+    index = InvertedIndex()
+    for doc_id, value in documents:
+        index.add(doc_id, value)
+    index.search('w0')  # builds the sorted vocabulary
+    build = time.perf_counter() - started
+
+    def scan(term):
+        return [doc_id for doc_id, value in documents if term in value]
+
+    # the scan is slow, a handful of queries is enough to see it
+    scan_p50, scan_p95 = timed(scan, terms[:10])
+    index_p50, index_p95 = timed(index.search, terms)
+
+    print('%d questions, index built in %.1fs' % (n, build))
+    print('%-16s %10s %10s' % ('backend', 'p50 ms', 'p95 ms'))
+    print('%-16s %10.2f %10.2f' % ('substring scan', scan_p50, scan_p95))
+    print('%-16s %10.2f %10.2f' % ('inverted index', index_p50, index_p95))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
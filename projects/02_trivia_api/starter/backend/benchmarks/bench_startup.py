@@ -0,0 +1,68 @@
+"""Benchmark app startup under each DB_SCHEMA_MODE.
+
+Times create_app() the way every worker boot and every test setUp pays
+for it: `create` runs db.create_all() (the old setup_db behaviour),
+`ensure` (the default) and `verify` reflect the schema once and then
+trust their stamp file, and `fast` issues no schema statements at all.
+
+Uses a throwaway SQLite file unless DATABASE_URL points at a database
+that already has the trivia schema (Postgres shows the reflection
+round-trips far more clearly).
+
+usage (from backend/): python benchmarks/bench_startup.py [boots]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flaskr import create_app
+from models import db
+
+MODES = ('create', 'ensure', 'verify', 'fast')
+
+statements = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+def boot(database_url, mode):
+    """Return (seconds, statements run) for one create_app()."""
+    del statements[:]
+    started = time.perf_counter()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'DB_SCHEMA_MODE': mode,
+    })
+    elapsed = time.perf_counter() - started
+    db.get_engine(app).dispose()
+    return elapsed, len(statements)
+
+
+def main(boots):
+    workdir = tempfile.mkdtemp()
+    database_url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(workdir, 'trivia.db')
+    os.environ['DB_SCHEMA_STAMP'] = os.path.join(workdir, 'schema.stamp')
+    os.environ.setdefault('DB_SLOW_QUERY_MS', '0')
+    if not os.environ.get('DATABASE_URL'):
+        boot(database_url, 'create')
+
+    print('%d boots against %s' % (boots, database_url.split('@')[-1]))
+    print('%-8s %10s %10s %12s' % ('mode', 'mean ms', 'first ms', 'statements'))
+    for mode in MODES:
+        samples = [boot(database_url, mode) for _ in range(boots)]
+        times = [elapsed for elapsed, _ in samples]
+        print('%-8s %10.2f %10.2f %12d' % (
+            mode, sum(times) / len(times) * 1000, times[0] * 1000, samples[-1][1]))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -1,29 +1,118 @@
 import os
-from flask import Flask, request, abort, jsonify
+import time
+import click
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
 from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
+import json
 
 from models import setup_db, Question, Category, db
+from .quiz import QuestionIndex
+from .sessions import QuizSessions, session_store_from_env
+from .cache import CategoryCache
+from .search import question_search_for, install_search_index
+from . import bulk
+from fsnd_shared.streaming import wants_stream, stream_json, STREAM_BATCH_SIZE
 
 QUESTIONS_PER_PAGE = 10
+COUNT_CACHE_TTL = 60
+CATEGORIES_MAX_AGE = 300
 
 # generate page of questions
 # request -- request body 
-# selection -- all questions
+# selection -- question query, only the requested page is loaded
+# ?after_id=<id> pages by keyset (id > after_id) instead of ?page offsets
 def paginate_questions(request, selection):
-  page = request.args.get('page', 1, type=int)
-  start = (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-  questions = [question.format() for question in selection]
-  current_qs = questions[start:end]
+  selection = selection.order_by(Question.id)
+  after_id = request.args.get('after_id', type=int)
+  if after_id is not None:
+    selection = selection.filter(Question.id > after_id)
+  else:
+    page = max(request.args.get('page', 1, type=int), 1)
+    selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+  current_qs = [question.format() for question in selection.limit(QUESTIONS_PER_PAGE)]
   return current_qs
 
+# COUNT(*) of questions, overall or per category, cached for COUNT_CACHE_TTL
+# seconds and dropped whenever a question is added or deleted
+question_counts = {}
+
+def count_questions(category=None):
+  cached = question_counts.get(category)
+  if cached and time.monotonic() - cached[1] < COUNT_CACHE_TTL:
+    return cached[0]
+  query = db.session.query(func.count(Question.id))
+  if category is not None:
+    query = query.filter(Question.category == category)
+  total = query.scalar()
+  question_counts[category] = (total, time.monotonic())
+  return total
+
+def invalidate_question_counts():
+  question_counts.clear()
+
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is not None:
+    app.config.from_mapping(test_config)
+  if 'SQLALCHEMY_DATABASE_URI' in app.config:
+    setup_db(app, app.config['SQLALCHEMY_DATABASE_URI'])
+  else:
+    setup_db(app)
+  question_index = QuestionIndex()
+  quiz_sessions = QuizSessions(question_index, session_store_from_env())
+  app.extensions['quiz_sessions'] = quiz_sessions
+
+  # categories are read once here and reloaded after a category write or
+  # once CATEGORY_CACHE_TTL runs out
+  category_cache = CategoryCache()
+  app.extensions['category_cache'] = category_cache
+  app.extensions['request_metrics'].register_stats('category_cache', category_cache.stats)
+  with app.app_context():
+    try:
+      category_cache.get()
+    except SQLAlchemyError:
+      # schema not there yet, the first request will load it
+      db.session.rollback()
+    question_search = question_search_for(db.engine)
+
+  # drop everything derived from the question table after a write
+  def questions_changed():
+    invalidate_question_counts()
+    question_index.invalidate()
+    question_search.invalidate()
+
+  @app.cli.command('create-search-index')
+  def create_search_index():
+    '''Create the full-text search index on an existing database.'''
+    install_search_index(db.engine)
+
+  @app.cli.command('import-questions')
+  @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+  @click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), default=None)
+  def import_questions_command(path, fmt):
+    '''Bulk load questions from an NDJSON or CSV file.'''
+    if fmt is None:
+      fmt = 'csv' if path.endswith('.csv') else 'ndjson'
+    with open(path, 'rb') as stream:
+      report = bulk.import_questions(stream, fmt, category_cache.get().by_id)
+    questions_changed()
+    click.echo(json.dumps(report, indent=2))
+    if 'failed' in report:
+      raise click.ClickException('import stopped, resume from line {}'.format(report['failed']['line']))
+
+  @app.cli.command('export-questions')
+  @click.argument('path', type=click.Path(dir_okay=False), default='-')
+  @click.option('--format', 'fmt', type=click.Choice(bulk.FORMATS), default='ndjson')
+  def export_questions_command(path, fmt):
+    '''Write every question to PATH (default stdout) as NDJSON or CSV.'''
+    with click.open_file(path, 'w') as out:
+      for chunk in bulk.export_questions(fmt):
+        out.write(chunk)
   
   '''
   Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -46,14 +135,18 @@ def create_app(test_config=None):
   @app.route('/categories')
   def get_categories():
     try:
-      result = Category.query.all()
-      categories = [category.type for category in result]
-      return jsonify({
+      categories = category_cache.get()
+      response = jsonify({
         'success': True,
-        'categories': categories
+        'categories': categories.types
       })
     except Exception as e:
       abort(400)
+    # let browsers and proxies revalidate with If-None-Match
+    response.set_etag(categories.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CATEGORIES_MAX_AGE
+    return response.make_conditional(request)
 
   '''
   Create an endpoint to handle GET requests for questions, 
@@ -68,14 +161,25 @@ def create_app(test_config=None):
   '''
   @app.route('/questions', methods=['GET'])
   def get_questions():
+    # ?stream=1 streams every question instead of one page
+    if wants_stream(request):
+      questions = Question.query.order_by(Question.id) \
+        .execution_options(stream_results=True) \
+        .yield_per(STREAM_BATCH_SIZE)
+      return stream_json({
+        'success': True,
+        'total_questions': count_questions(),
+        'categories': category_cache.get().types,
+        'current_category': None
+      }, 'questions', (question.format() for question in questions))
+
     try:
-      qs = Question.query.all()
-      pageQs = paginate_questions(request, qs)
-      categories = [cat.type for cat in Category.query.all()]
+      pageQs = paginate_questions(request, Question.query)
+      categories = category_cache.get().types
       return jsonify({
         'success': True,
         'questions': pageQs,
-        'total_questions': len(qs),
+        'total_questions': count_questions(),
         'categories': categories,
         'current_category': None
       })
@@ -94,6 +198,7 @@ def create_app(test_config=None):
       question = Question.query.get(id)
       db.session.delete(question)
       db.session.commit()
+      questions_changed()
       return jsonify({
         'success': True,
         'question_id': question.id
@@ -128,13 +233,13 @@ def create_app(test_config=None):
 
       # check for searchTerm request vs adding new question
       if data.get('searchTerm'):
-        search = data.get('searchTerm')
-        response = Question.query.filter(func.lower(Question.question).like('%' + search + '%')).all()
-        pageQs = paginate_questions(request, response)
+        search = data.get('searchTerm').lower()
+        page = max(request.args.get('page', 1, type=int), 1)
+        questions, total = question_search.search(search, page, QUESTIONS_PER_PAGE)
         return jsonify({
           'success': True,
-          'questions': pageQs,
-          'total_questions': len(response),
+          'questions': [question.format() for question in questions],
+          'total_questions': total,
           'currentCategory': None
         })
 
@@ -143,6 +248,7 @@ def create_app(test_config=None):
         question = Question(question=data.get('question'), answer=data.get('answer'), category=category, difficulty=data.get('difficulty'))
         db.session.add(question)
         db.session.commit()
+        questions_changed()
         return jsonify({
           'success': True,
           'question_id': question.id
@@ -154,6 +260,37 @@ def create_app(test_config=None):
     finally:
       db.session.close()
 
+  '''
+  Bulk load questions. The body is NDJSON (one question object per line)
+  or CSV with a question,answer,category,difficulty header, picked from
+  ?format= or the Content-Type. Rows are validated and inserted in chunks;
+  the response reports how many were inserted and why others were rejected.
+  '''
+  @app.route('/questions/import', methods=['POST'])
+  def import_questions():
+    fmt = request.args.get('format') or bulk.format_from_mimetype(request.mimetype)
+    if fmt not in bulk.FORMATS:
+      abort(400)
+    try:
+      report = bulk.import_questions(request.stream, fmt, category_cache.get().by_id)
+    finally:
+      questions_changed()
+    # the chunks before a failure are committed, report them and where
+    # to resume rather than a bare 422
+    report['success'] = 'failed' not in report
+    return jsonify(report), 200 if report['success'] else 422
+
+  '''
+  Stream every question as NDJSON (default) or CSV with ?format=csv.
+  '''
+  @app.route('/questions/export', methods=['GET'])
+  def export_questions():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in bulk.FORMATS:
+      abort(400)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(bulk.export_questions(fmt)), mimetype=mimetype)
+
   '''
   Create a GET endpoint to get questions based on category. 
 
@@ -164,19 +301,26 @@ def create_app(test_config=None):
   @app.route('/categories/<int:id>/questions', methods=['GET'])
   def get_questions_by_category(id):
     try:
-      category = Category.query.get(id+1) # bug with id indexing (categories DB start with 1, frontend start with 0)
-      qs = Question.query.filter_by(category=category.id).all()
+      category_id = id + 1 # bug with id indexing (categories DB start with 1, frontend start with 0)
+      if category_id not in category_cache.get().by_id:
+        abort(404)
+      qs = Question.query.filter_by(category=category_id)
       pageQs = paginate_questions(request, qs)
-      categories = [cat.type for cat in Category.query.all()]
       return jsonify({
         'success': True,
         'questions': pageQs,
-        'total_questions': len(qs),
-        'current_category': category.id
+        'total_questions': count_questions(category_id),
+        'current_category': category_id
       })
     except:
       abort(404)
 
+  # category id from a quiz request body, None for all categories
+  def quiz_category_id(data):
+    if data.get('quiz_category'):
+      return int(data.get('quiz_category').get('id')) + 1 # bug with id indexing (categories DB start with 1, frontend start with 0)
+    return None
+
   '''
   Create a POST endpoint to get questions to play the quiz. 
   This endpoint should take category and previous question parameters 
@@ -189,24 +333,26 @@ def create_app(test_config=None):
   '''
   @app.route('/quizzes', methods=['POST'])
   def play_quiz():
+    data = request.get_json(silent=True)
+
+    # session protocol: the server remembers which questions were asked
+    if data and data.get('session_id'):
+      try:
+        rand_question = quiz_sessions.next_question(data.get('session_id'), Question.query.get)
+      except KeyError:
+        abort(404)
+      return jsonify({
+        'success': True,
+        'session_id': data.get('session_id'),
+        'question': rand_question.format() if rand_question else None,
+      })
+
     try:
-      data = request.get_json()
-      previous_qs = data.get('previous_questions')
+      previous_qs = data.get('previous_questions') or []
 
-      # gather all questions or questions within category
-      if data.get('quiz_category'):
-        category = int(data.get('quiz_category').get('id')) + 1 # bug with id indexing (categories DB start with 1, frontend start with 0)
-        questions = Question.query.filter_by(category=category).all()
-      else:
-        questions = Question.query.all()
-
-      # get random question not already asked
-      rand_question = questions[random.randint(0, len(questions)-1)]
-      while rand_question.id in previous_qs:
-        if len(previous_qs) == len(questions):
-          rand_question = None
-          break
-        rand_question = questions[random.randint(0, len(questions)-1)]
+      # pick a random question not already asked, within category if provided
+      category = quiz_category_id(data)
+      rand_question = question_index.next_question(category, previous_qs)
       
       # can't format 'None' type
       if rand_question:
@@ -219,6 +365,32 @@ def create_app(test_config=None):
     except:
       abort(400)
 
+  '''
+  Start a server-side quiz session for a category (or all categories).
+  The session holds a shuffled queue of question ids; POST /quizzes with
+  the returned session_id to get the next question.
+  '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def start_quiz_session():
+    try:
+      data = request.get_json(silent=True) or {}
+      session_id, total = quiz_sessions.start(quiz_category_id(data))
+      return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'total_questions': total
+      })
+    except:
+      abort(400)
+
+  @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+  def end_quiz_session(session_id):
+    quiz_sessions.end(session_id)
+    return jsonify({
+      'success': True,
+      'session_id': session_id
+    })
+
   '''
   Create error handlers for all expected errors 
   including 400, 404, 422, and 500. 
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from models import db, Question
+
+CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+# keep the error report bounded no matter how bad the input is
+MAX_REPORTED_ERRORS = 1000
+
+COLUMNS = ('question', 'answer', 'category', 'difficulty')
+EXPORT_COLUMNS = ('id',) + COLUMNS
+FORMATS = ('ndjson', 'csv')
+
+def format_from_mimetype(mimetype, default='ndjson'):
+  if mimetype in ('text/csv', 'application/csv'):
+    return 'csv'
+  if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+    return 'ndjson'
+  return default
+
+'''
+read_rows(stream, fmt)
+  yields (line number, row dict or None, error or None) from a binary stream
+  of NDJSON objects or CSV with a question,answer,category,difficulty header
+'''
+def read_rows(stream, fmt):
+  text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+  if fmt == 'csv':
+    reader = csv.DictReader(text)
+    for row in reader:
+      yield reader.line_num, row, None
+    return
+  for line_no, line in enumerate(text, 1):
+    if not line.strip():
+      continue
+    try:
+      row = json.loads(line)
+    except ValueError as e:
+      yield line_no, None, 'invalid json: {}'.format(e)
+      continue
+    if not isinstance(row, dict):
+      yield line_no, None, 'expected a json object'
+      continue
+    yield line_no, row, None
+
+'''
+validate(row, category_ids)
+  returns (values, None) ready for insert, or (None, error message)
+'''
+def validate(row, category_ids):
+  values = {}
+  for column in ('question', 'answer'):
+    value = row.get(column)
+    if not isinstance(value, str) or not value.strip():
+      return None, '{} is required'.format(column)
+    values[column] = value.strip()
+  for column in ('category', 'difficulty'):
+    try:
+      values[column] = int(row.get(column))
+    except (TypeError, ValueError):
+      return None, '{} must be an integer'.format(column)
+  if values['category'] not in category_ids:
+    return None, 'unknown category {}'.format(values['category'])
+  if not 1 <= values['difficulty'] <= 5:
+    return None, 'difficulty must be between 1 and 5'
+  return values, None
+
+def copy_rows(connection, rows):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow([row[column] for column in COLUMNS])
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert(
+    'COPY questions ({}) FROM STDIN WITH (FORMAT csv)'.format(', '.join(COLUMNS)),
+    buffer
+  )
+
+def insert_rows(rows):
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    copy_rows(connection, rows)
+  else:
+    connection.execute(Question.__table__.insert(), rows)
+
+'''
+import_questions(stream, fmt, category_ids)
+  validates and inserts rows CHUNK_SIZE at a time, one commit per chunk,
+  with COPY on Postgres and executemany elsewhere; memory use depends on
+  the chunk size, not on the input size
+  returns {'inserted', 'rejected', 'errors': [{'line', 'error'}]}
+
+  chunks committed before a failure stay in the database, so a failure
+  does not raise: the report covers the committed chunks and gains
+  'failed': {'line', 'error'}, where line is the first line of the chunk
+  that was rolled back, the line to resume the import from
+'''
+def import_questions(stream, fmt, category_ids, chunk_size=CHUNK_SIZE):
+  report = {'inserted': 0, 'rejected': 0, 'errors': []}
+  rows = read_rows(stream, fmt)
+  next_line = 1
+  while True:
+    rejected = []
+    try:
+      chunk = list(islice(rows, chunk_size))
+      if not chunk:
+        break
+      valid = []
+      for line_no, row, error in chunk:
+        if error is None:
+          values, error = validate(row, category_ids)
+        if error is not None:
+          rejected.append({'line': line_no, 'error': error})
+        else:
+          valid.append(values)
+      if valid:
+        insert_rows(valid)
+        db.session.commit()
+    except Exception as e:
+      db.session.rollback()
+      report['failed'] = {
+        'line': next_line,
+        'error': '{}: {}'.format(e.__class__.__name__, e)[:500]
+      }
+      break
+    report['inserted'] += len(valid)
+    report['rejected'] += len(rejected)
+    room = MAX_REPORTED_ERRORS - len(report['errors'])
+    report['errors'].extend(rejected[:room])
+    next_line = chunk[-1][0] + 1
+  return report
+
+'''
+export_questions(fmt)
+  yields the question table as NDJSON lines or CSV, reading rows off a
+  server-side cursor in batches of EXPORT_BATCH_SIZE
+'''
+def export_questions(fmt):
+  rows = db.session.query(*[getattr(Question, column) for column in EXPORT_COLUMNS]) \
+    .order_by(Question.id) \
+    .execution_options(stream_results=True) \
+    .yield_per(EXPORT_BATCH_SIZE)
+
+  if fmt == 'csv':
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+      writer.writerow(row)
+      if buffer.tell() > 64 * 1024:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+    return
+
+  for row in rows:
+    yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n'
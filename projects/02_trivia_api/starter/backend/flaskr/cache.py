@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from models import Category, on_categories_changed
+
+CategoryList = namedtuple('CategoryList', ['types', 'by_id', 'etag'])
+
+# seconds a loaded list is served before it is read again, which bounds
+# how long other workers serve categories written elsewhere
+CATEGORY_CACHE_TTL = float(os.environ.get('CATEGORY_CACHE_TTL', 60))
+
+'''
+CategoryCache
+  app-level copy of the category list and id -> type map
+
+  categories almost never change, so they are read once and kept until a
+  commit in this process writes a Category (see models.on_categories_changed)
+  or `ttl` seconds pass, whichever comes first
+  etag is a strong validator of the list for conditional GETs
+'''
+class CategoryCache(object):
+  def __init__(self, ttl=CATEGORY_CACHE_TTL, clock=time.monotonic):
+    self.ttl = ttl
+    self.clock = clock
+    self._lock = threading.Lock()
+    self._entry = None
+    self._expires_at = 0.0
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+    on_categories_changed(self)
+
+  def _load(self):
+    categories = Category.query.order_by(Category.id).all()
+    types = [category.type for category in categories]
+    by_id = {category.id: category.type for category in categories}
+    etag = hashlib.sha1(json.dumps(types).encode('utf-8')).hexdigest()
+    return CategoryList(types, by_id, etag)
+
+  def _fresh(self):
+    return self._entry is not None and self.clock() < self._expires_at
+
+  def get(self):
+    entry = self._entry
+    if entry is not None and self.clock() < self._expires_at:
+      self.hits += 1
+      return entry
+    with self._lock:
+      if self._fresh():
+        self.hits += 1
+      else:
+        self.misses += 1
+        self._entry = self._load()
+        self._expires_at = self.clock() + self.ttl
+      return self._entry
+
+  def invalidate(self):
+    with self._lock:
+      self._entry = None
+      self.invalidations += 1
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'invalidations': self.invalidations
+    }
@@ -0,0 +1,101 @@
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import func
+
+from models import db, Question
+
+# random draws tried before falling back to listing the unseen ids
+MAX_DRAWS = 8
+
+# seconds an index entry is trusted before it is checked against the table
+INDEX_CHECK_INTERVAL = float(os.environ.get('QUIZ_INDEX_CHECK_INTERVAL', 5))
+
+IndexEntry = namedtuple('IndexEntry', ['ids', 'stamp', 'checked_at'])
+
+'''
+QuestionIndex
+  in-memory index of question ids per category (None = all categories)
+
+  picking the next quiz question only touches this index plus one primary
+  key lookup, instead of loading every question of the category
+  the index is built lazily; writes in this process invalidate() it, and
+  writes from other workers or `flask import-questions` are picked up by
+  comparing the category's COUNT/max(id) with the index at most every
+  check_interval seconds
+'''
+class QuestionIndex(object):
+  def __init__(self, rng=None, check_interval=INDEX_CHECK_INTERVAL, clock=time.monotonic):
+    self.rng = rng or random.Random()
+    self.check_interval = check_interval
+    self.clock = clock
+    self._ids = {}
+    self._lock = threading.Lock()
+
+  def _query(self, category, *columns):
+    query = db.session.query(*columns)
+    if category is not None:
+      query = query.filter(Question.category == category)
+    return query
+
+  # (row count, highest id) of category; the id sequence never hands out
+  # an id twice, so any insert or delete changes it
+  def stamp(self, category=None):
+    count, max_id = self._query(category, func.count(Question.id), func.max(Question.id)).one()
+    return count, max_id
+
+  def ids(self, category=None):
+    entry = self._ids.get(category)
+    now = self.clock()
+    if entry is not None:
+      if now - entry.checked_at < self.check_interval:
+        return entry.ids
+      if self.stamp(category) == entry.stamp:
+        self._ids[category] = entry._replace(checked_at=now)
+        return entry.ids
+    ids = [row.id for row in self._query(category, Question.id)]
+    with self._lock:
+      self._ids[category] = IndexEntry(ids, (len(ids), max(ids, default=None)), now)
+    return ids
+
+  def invalidate(self):
+    with self._lock:
+      self._ids.clear()
+
+  '''
+  pick(category, exclude)
+    returns a random question id of category not in exclude, or None
+    random draws with a set lookup are O(1) each; only when most of the
+    category has been seen does it list the remaining ids
+  '''
+  def pick(self, category=None, exclude=()):
+    ids = self.ids(category)
+    if not ids:
+      return None
+    seen = set(exclude)
+    for _ in range(MAX_DRAWS):
+      question_id = self.rng.choice(ids)
+      if question_id not in seen:
+        return question_id
+    unseen = [question_id for question_id in ids if question_id not in seen]
+    if not unseen:
+      return None
+    return self.rng.choice(unseen)
+
+  '''
+  next_question(category, exclude)
+    returns the next unseen Question of category, or None when exhausted
+  '''
+  def next_question(self, category=None, exclude=()):
+    question_id = self.pick(category, exclude)
+    if question_id is None:
+      return None
+    question = Question.query.get(question_id)
+    if question is None:
+      # deleted since the index was built
+      self.invalidate()
+      return self.next_question(category, exclude)
+    return question
@@ -0,0 +1,138 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func, literal_column, text
+
+from models import db, Question
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SEARCH_INDEX_NAME = 'ix_questions_search'
+
+# same expression as the GIN index, so Postgres can use it
+SEARCH_DOCUMENT = (
+  "to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, ''))"
+)
+
+CREATE_SEARCH_INDEX = (
+  'CREATE INDEX IF NOT EXISTS {name} ON questions USING gin ({document})'
+).format(name=SEARCH_INDEX_NAME, document=SEARCH_DOCUMENT)
+
+def tokenize(value):
+  return TOKEN_RE.findall((value or '').lower())
+
+def install_search_index(engine):
+  if engine.dialect.name == 'postgresql':
+    with engine.begin() as conn:
+      conn.execute(text(CREATE_SEARCH_INDEX))
+
+'''
+PostgresQuestionSearch
+  full-text search over question and answer text using the
+  ix_questions_search GIN index, every word of the term is matched as a
+  prefix; results are ranked with ts_rank_cd and paginated in the database
+'''
+class PostgresQuestionSearch(object):
+  def search(self, term, page, per_page):
+    words = tokenize(term)
+    if not words:
+      return [], 0
+    query = func.to_tsquery('english', ' & '.join(word + ':*' for word in words))
+    document = literal_column(SEARCH_DOCUMENT)
+    matches = Question.query.filter(document.op('@@')(query))
+
+    total = matches.with_entities(func.count(Question.id)).scalar()
+    questions = matches \
+      .order_by(func.ts_rank_cd(document, query).desc(), Question.id) \
+      .offset((page - 1) * per_page) \
+      .limit(per_page) \
+      .all()
+    return questions, total
+
+  def invalidate(self):
+    pass
+
+'''
+InvertedIndex
+  in-process inverted index: token -> {id: term frequency}
+  a sorted vocabulary gives prefix lookups by bisection
+'''
+class InvertedIndex(object):
+  def __init__(self):
+    self.postings = defaultdict(dict)
+    self.lengths = {}
+    self._vocabulary = None
+
+  def add(self, doc_id, value):
+    tokens = tokenize(value)
+    self.lengths[doc_id] = len(tokens) or 1
+    for token in tokens:
+      postings = self.postings[token]
+      postings[doc_id] = postings.get(doc_id, 0) + 1
+    self._vocabulary = None
+
+  def _expand(self, prefix):
+    if self._vocabulary is None:
+      self._vocabulary = sorted(self.postings)
+    start = bisect.bisect_left(self._vocabulary, prefix)
+    end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+    return self._vocabulary[start:end]
+
+  # ids matching every word (as a prefix), best match first
+  def search(self, term):
+    scores = None
+    for word in tokenize(term):
+      word_scores = defaultdict(float)
+      for token in self._expand(word):
+        for doc_id, count in self.postings[token].items():
+          word_scores[doc_id] += count / self.lengths[doc_id]
+      if scores is None:
+        scores = word_scores
+      else:
+        scores = {doc_id: score + word_scores[doc_id]
+                  for doc_id, score in scores.items() if doc_id in word_scores}
+      if not scores:
+        return []
+    if not scores:
+      return []
+    return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+'''
+InMemoryQuestionSearch
+  fallback for SQLite test runs: same ranking contract as the Postgres
+  backend, built lazily from the table and dropped on question writes
+'''
+class InMemoryQuestionSearch(object):
+  def __init__(self):
+    self._index = None
+    self._lock = threading.Lock()
+
+  def _get_index(self):
+    index = self._index
+    if index is None:
+      index = InvertedIndex()
+      for row in db.session.query(Question.id, Question.question, Question.answer):
+        index.add(row.id, '{} {}'.format(row.question or '', row.answer or ''))
+      with self._lock:
+        self._index = index
+    return index
+
+  def search(self, term, page, per_page):
+    ids = self._get_index().search(term)
+    start = (page - 1) * per_page
+    page_ids = ids[start:start + per_page]
+    if not page_ids:
+      return [], len(ids)
+    found = {q.id: q for q in Question.query.filter(Question.id.in_(page_ids))}
+    return [found[i] for i in page_ids if i in found], len(ids)
+
+  def invalidate(self):
+    with self._lock:
+      self._index = None
+
+def question_search_for(engine):
+  if engine.dialect.name == 'postgresql':
+    return PostgresQuestionSearch()
+  return InMemoryQuestionSearch()
@@ -0,0 +1,119 @@
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+SESSION_TTL = int(os.environ.get('QUIZ_SESSION_TTL', 3600))
+MAX_SESSIONS = int(os.environ.get('QUIZ_SESSION_MAX', 10000))
+
+'''
+MemorySessionStore
+  bounded, TTL'd store of question id queues, one per quiz session
+  least recently used sessions are evicted once max_sessions is reached
+'''
+class MemorySessionStore(object):
+  def __init__(self, max_sessions=MAX_SESSIONS, clock=time.monotonic):
+    self.max_sessions = max_sessions
+    self.clock = clock
+    self._sessions = OrderedDict()
+    self._lock = threading.Lock()
+
+  def create(self, key, ids, ttl):
+    with self._lock:
+      self._sessions[key] = (self.clock() + ttl, deque(ids))
+      self._sessions.move_to_end(key)
+      while len(self._sessions) > self.max_sessions:
+        self._sessions.popitem(last=False)
+
+  # next id of the session, None when exhausted, KeyError if unknown/expired
+  def pop(self, key):
+    with self._lock:
+      expires_at, ids = self._sessions[key]
+      if expires_at <= self.clock():
+        del self._sessions[key]
+        raise KeyError(key)
+      self._sessions.move_to_end(key)
+      return ids.popleft() if ids else None
+
+  def delete(self, key):
+    with self._lock:
+      self._sessions.pop(key, None)
+
+'''
+RedisSessionStore
+  same interface backed by a redis list per session (RPUSH / LPOP),
+  so sessions survive restarts and are shared between workers
+  client is anything speaking the redis-py API, e.g. redis.Redis or a
+  local stand-in such as fakeredis.FakeRedis
+'''
+class RedisSessionStore(object):
+  def __init__(self, client, prefix='quiz:session:'):
+    self.client = client
+    self.prefix = prefix
+
+  def create(self, key, ids, ttl):
+    name = self.prefix + key
+    pipe = self.client.pipeline()
+    pipe.delete(name)
+    if ids:
+      pipe.rpush(name, *ids)
+      pipe.expire(name, ttl)
+    # redis drops empty lists, this key tells "finished" from "unknown"
+    pipe.set(name + ':alive', 1, ex=ttl)
+    pipe.execute()
+
+  def pop(self, key):
+    name = self.prefix + key
+    pipe = self.client.pipeline()
+    pipe.lpop(name)
+    pipe.exists(name + ':alive')
+    value, alive = pipe.execute()
+    if not alive:
+      raise KeyError(key)
+    return int(value) if value is not None else None
+
+  def delete(self, key):
+    self.client.delete(self.prefix + key, self.prefix + key + ':alive')
+
+def session_store_from_env():
+  url = os.environ.get('QUIZ_SESSION_REDIS_URL')
+  if not url:
+    return MemorySessionStore()
+  import redis
+  return RedisSessionStore(redis.Redis.from_url(url))
+
+'''
+QuizSessions
+  a quiz session is a pre-shuffled queue of question ids for a category;
+  each round pops the next id, so the client no longer sends back
+  previous_questions and every round is constant size and time
+'''
+class QuizSessions(object):
+  def __init__(self, question_index, store=None, ttl=SESSION_TTL, rng=None):
+    self.question_index = question_index
+    self.store = store if store is not None else MemorySessionStore()
+    self.ttl = ttl
+    self.rng = rng or random.Random()
+
+  def start(self, category=None):
+    ids = list(self.question_index.ids(category))
+    self.rng.shuffle(ids)
+    session_id = uuid.uuid4().hex
+    self.store.create(session_id, ids, self.ttl)
+    return session_id, len(ids)
+
+  # next Question of the session, None when finished, KeyError if unknown
+  def next_question(self, session_id, load):
+    while True:
+      question_id = self.store.pop(session_id)
+      if question_id is None:
+        return None
+      question = load(question_id)
+      # skip questions deleted since the session started
+      if question is not None:
+        return question
+
+  def end(self, session_id):
+    self.store.delete(session_id)
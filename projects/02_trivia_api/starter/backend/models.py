@@ -1,8 +1,12 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import weakref
+from sqlalchemy import Column, String, Integer, create_engine, event
+from sqlalchemy.orm import Session, object_session
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_shared import db_bootstrap, request_metrics
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('thomaskeyes@localhost:5432', database_name)
 
@@ -11,13 +15,19 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    there are no migrations yet, so the tables are created on the first
+    boot of a deploy unless DB_SCHEMA_MODE says otherwise
+    (see fsnd_shared.db_bootstrap)
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db_bootstrap.configure(app)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    db_bootstrap.instrument(app, db)
+    request_metrics.instrument(app, db)
+    db_bootstrap.prepare_schema(app, db, default='ensure')
 
 '''
 Question
@@ -29,7 +39,7 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer)
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -75,4 +85,32 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+on_categories_changed(cache)
+    registers an object whose invalidate() is called after every commit
+    that inserted, updated or deleted a Category
+'''
+category_watchers = weakref.WeakSet()
+
+def on_categories_changed(cache):
+  category_watchers.add(cache)
+
+def _mark_categories_changed(mapper, connection, target):
+  session = object_session(target)
+  if session is not None:
+    session.info['categories_changed'] = True
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+  event.listen(Category, _event, _mark_categories_changed)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_category_watchers(session):
+  if session.info.pop('categories_changed', False):
+    for cache in list(category_watchers):
+      cache.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_category_changes(session):
+  session.info.pop('categories_changed', None)
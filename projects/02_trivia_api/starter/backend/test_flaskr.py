@@ -1,40 +1,39 @@
+import io
 import os
+import threading
+import time
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
+from sqlalchemy import text
 
-class TriviaTestCase(unittest.TestCase):
+from flaskr import bulk
+from flaskr.cache import CategoryCache
+from flaskr.quiz import QuestionIndex
+from flaskr.sessions import MemorySessionStore, RedisSessionStore
+from models import db, Question, Category
+from testing import TransactionalTestCase
+
+
+class TriviaTestCase(TransactionalTestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        # one seeded schema per process, each test is rolled back
+        super().setUp()
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-        
         self.new_question = {
             "question": "Test Question",
             "answer": "Test Answer",
             "category": 2,
             "difficulty": 2
         }
-    
-    def tearDown(self):
-        """Executed after reach test"""
-        pass
 
     """
     Write at least one test for each test for successful operation and for expected errors.
@@ -46,6 +45,15 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['categories'])
 
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers.get('ETag')
+        self.assertTrue(etag)
+        self.assertIn('max-age', res.headers.get('Cache-Control'))
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
     def test_400_quizzes_no_body(self):
         res = self.client().post('/quizzes')
         data = json.loads(res.data)
@@ -76,12 +84,93 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['questions']))
         self.assertTrue(data['categories'])
 
+    def test_get_questions_after_id(self):
+        res = self.client().get('/questions?after_id=5')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(len(data['questions']) <= 10)
+        self.assertTrue(all(q['id'] > 5 for q in data['questions']))
+        ids = [q['id'] for q in data['questions']]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_get_questions_page_out_of_range(self):
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], [])
+        self.assertTrue(data['total_questions'])
+
+    def test_get_questions_streamed(self):
+        res = self.client().get('/questions?stream=1')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['categories'])
+        self.assertEqual(len(data['questions']), data['total_questions'])
+
     def test_create_new_question(self):
         res = self.client().post('/questions', json=self.new_question)
         data = json.loads(res.data)
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
 
+    def test_delete_question(self):
+        res = self.client().delete('/questions/5')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        with self.app.app_context():
+            self.assertIsNone(Question.query.get(5))
+
+    def test_import_questions(self):
+        body = '\n'.join([
+            json.dumps(self.new_question),
+            json.dumps(dict(self.new_question, difficulty=10)),
+            '{not json'
+        ])
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['rejected'], 2)
+        self.assertEqual([error['line'] for error in data['errors']], [2, 3])
+
+    def test_import_reports_where_to_resume(self):
+        line = json.dumps(self.new_question).encode('utf-8') + b'\n'
+        body = io.BytesIO(line * 200 + b'\xff\n' + line)
+        with self.app.app_context():
+            before = Question.query.count()
+            report = bulk.import_questions(body, 'ndjson', {1, 2, 3, 4, 5, 6}, chunk_size=50)
+            inserted = Question.query.count() - before
+        self.assertEqual(report['inserted'], inserted)
+        self.assertGreater(report['inserted'], 0)
+        self.assertEqual(report['inserted'] % 50, 0)
+        self.assertEqual(report['failed']['line'], inserted + 1)
+        self.assertIn('UnicodeDecodeError', report['failed']['error'])
+
+    def test_422_import_failure_returns_partial_report(self):
+        res = self.client().post('/questions/import', data=b'\xff\n', content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['inserted'], 0)
+        self.assertEqual(data['failed']['line'], 1)
+
+    def test_400_import_unknown_format(self):
+        res = self.client().post('/questions/import?format=xml', data='')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export?format=csv')
+        lines = res.data.decode('utf-8').splitlines()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(lines[0], 'id,question,answer,category,difficulty')
+        self.assertTrue(len(lines) > 1)
+
     def test_search_response(self):
         res = self.client().post('/questions', json={"searchTerm": "title"})
         data = json.loads(res.data)
@@ -107,6 +196,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['question'])
     
+    def test_playing_quiz_skips_previous_questions(self):
+        question = {"previous_questions": list(range(1, 1000))}
+        res = self.client().post('/quizzes', json=question)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertIsNone(data['question'])
+
     def test_playing_quiz_with_category(self):
         question = {
             "previous_questions": [], 
@@ -122,6 +219,122 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question'])
         self.assertEqual(data['question']['category']-1, question['quiz_category']['id']) # GUI needs to start at 1
 
+    def test_question_index_sees_writes_from_other_processes(self):
+        with self.app.app_context():
+            index = QuestionIndex(check_interval=0)
+            science = sorted(index.ids(1))
+            # inserted without questions_changed(), as another worker would
+            question = Question(question='Q', answer='A', category=1, difficulty=1)
+            question.insert()
+            self.assertEqual(sorted(index.ids(1)), science + [question.id])
+            question.delete()
+            self.assertEqual(sorted(index.ids(1)), science)
+
+    def test_category_cache_expires(self):
+        now = [0.0]
+        cache = CategoryCache(ttl=60, clock=lambda: now[0])
+        with self.app.app_context():
+            categories = cache.get()
+            # written without the commit hook, as another worker would
+            db.session.execute(text("INSERT INTO categories (type) VALUES ('Cooking')"))
+            self.assertIs(cache.get(), categories)
+            now[0] = 60
+            reloaded = cache.get()
+        self.assertIn('Cooking', reloaded.types)
+        self.assertNotEqual(reloaded.etag, categories.etag)
+
+    def test_question_index_trusts_entry_within_interval(self):
+        with self.app.app_context():
+            index = QuestionIndex(check_interval=60)
+            science = list(index.ids(1))
+            Question(question='Q', answer='A', category=1, difficulty=1).insert()
+            self.assertEqual(index.ids(1), science)
+
+
+class QuizSessionTestCase(TransactionalTestCase):
+    """Quiz sessions on the in-process store"""
+
+    def make_store(self):
+        return MemorySessionStore()
+
+    def setUp(self):
+        super().setUp()
+        self.sessions = self.app.extensions['quiz_sessions']
+        self.sessions.store = self.make_store()
+
+    def start_session(self):
+        res = self.client().post('/quizzes/sessions', json={"quiz_category": {"id": 0, "type": "Science"}})
+        return json.loads(res.data)
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={"quiz_category": {"id": 0, "type": "Science"}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['total_questions'])
+
+        asked = []
+        for _ in range(data['total_questions']):
+            res = self.client().post('/quizzes', json={"session_id": data['session_id']})
+            question = json.loads(res.data)['question']
+            self.assertEqual(question['category'], 1)
+            asked.append(question['id'])
+        self.assertEqual(len(asked), len(set(asked)))
+
+        res = self.client().post('/quizzes', json={"session_id": data['session_id']})
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_404_quiz_session_not_found(self):
+        res = self.client().post('/quizzes', json={"session_id": "does-not-exist"})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+
+    def test_end_quiz_session(self):
+        session_id = self.start_session()['session_id']
+        res = self.client().delete('/quizzes/sessions/' + session_id)
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/quizzes', json={"session_id": session_id})
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_session_expires(self):
+        self.sessions.ttl = 1
+        session_id = self.start_session()['session_id']
+        res = self.client().post('/quizzes', json={"session_id": session_id})
+        self.assertEqual(res.status_code, 200)
+        time.sleep(1.1)
+        res = self.client().post('/quizzes', json={"session_id": session_id})
+        self.assertEqual(res.status_code, 404)
+
+    def test_concurrent_answers_never_repeat_a_question(self):
+        store = self.sessions.store
+        ids = list(range(1, 501))
+        store.create('concurrent', ids, 60)
+        asked = []
+
+        def answer():
+            while True:
+                question_id = store.pop('concurrent')
+                if question_id is None:
+                    return
+                asked.append(question_id)
+
+        threads = [threading.Thread(target=answer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(asked), ids)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisQuizSessionTestCase(QuizSessionTestCase):
+    """The same quiz session tests on RedisSessionStore, against fakeredis"""
+
+    def make_store(self):
+        return RedisSessionStore(fakeredis.FakeStrictRedis())
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
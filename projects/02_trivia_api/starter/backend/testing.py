@@ -0,0 +1,171 @@
+"""Transactional test harness for the trivia backend.
+
+The schema is created and seeded from trivia.psql once per process, then
+every test runs inside a transaction on a single connection that is
+rolled back in tearDown. Application commits only release a SAVEPOINT,
+which is reopened straight away, so tests never see each other's writes.
+
+Database selection (all offline):
+  TRIVIA_TEST_DATABASE_URL unset   a SQLite file in the temp directory
+  TRIVIA_TEST_DATABASE_URL=...     SQLite or a local Postgres
+Under pytest-xdist every worker gets its own SQLite file or Postgres
+database (suffixed with PYTEST_XDIST_WORKER), created when missing.
+"""
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import scoped_session
+
+from flaskr import create_app, invalidate_question_counts
+from flaskr.search import install_search_index
+from models import db, Question, Category
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
+
+_engine = None
+
+
+def worker_id():
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
+def is_postgres(url):
+    return url.get_backend_name() in ('postgresql', 'postgres')
+
+
+def database_url():
+    """The test database URL for this worker."""
+    worker = worker_id()
+    url = os.environ.get('TRIVIA_TEST_DATABASE_URL')
+    if not url:
+        path = os.path.join(tempfile.gettempdir(), 'trivia_test_{}.db'.format(worker))
+        return make_url('sqlite:///' + path)
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        root, ext = os.path.splitext(url.database)
+        url.database = '{}_{}{}'.format(root, worker, ext)
+    else:
+        url.database = '{}_{}'.format(url.database, worker)
+    return url
+
+
+def ensure_database(url):
+    """Create the Postgres database for this worker if it does not exist."""
+    if not is_postgres(url):
+        return
+    maintenance = make_url(str(url))
+    maintenance.database = 'postgres'
+    engine = create_engine(maintenance, isolation_level='AUTOCOMMIT')
+    try:
+        with engine.connect() as conn:
+            exists = conn.execute(
+                text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                name=url.database
+            ).scalar()
+            if not exists:
+                conn.execute(text('CREATE DATABASE "{}"'.format(url.database)))
+    finally:
+        engine.dispose()
+
+
+def seed_rows(table):
+    """Rows of the COPY block for table in trivia.psql, as dicts."""
+    rows = []
+    with open(SCHEMA_FILE, encoding='utf-8') as schema:
+        lines = iter(schema)
+        for line in lines:
+            if line.startswith('COPY public.{} ('.format(table)):
+                columns = line[line.index('(') + 1:line.index(')')].split(', ')
+                break
+        else:
+            return rows
+        for line in lines:
+            line = line.rstrip('\n')
+            if line == '\\.':
+                break
+            rows.append(dict(zip(columns, line.split('\t'))))
+    return rows
+
+
+def enable_sqlite_savepoints(engine):
+    """pysqlite manages BEGIN itself and gets SAVEPOINTs wrong, take over."""
+    @event.listens_for(engine, 'connect')
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def do_begin(conn):
+        conn.execute(text('BEGIN'))
+
+
+def setup_database():
+    """Create, seed and return the engine for this worker, once per process."""
+    global _engine
+    if _engine is not None:
+        return _engine
+    url = database_url()
+    ensure_database(url)
+    engine = create_engine(url)
+    if url.get_backend_name() == 'sqlite':
+        enable_sqlite_savepoints(engine)
+    db.Model.metadata.drop_all(engine)
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Category.__table__.insert(), seed_rows('categories'))
+        conn.execute(Question.__table__.insert(), seed_rows('questions'))
+        if is_postgres(url):
+            for table in ('categories', 'questions'):
+                conn.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                    "(SELECT max(id) FROM {0}))".format(table)
+                ))
+    install_search_index(engine)
+    _engine = engine
+    return engine
+
+
+def transactional_session(connection):
+    """A scoped session on connection whose commits stop at a SAVEPOINT."""
+    factory = db.create_session({'bind': connection, 'binds': {}})
+
+    def make_session():
+        session = factory()
+        session.begin_nested()
+
+        @event.listens_for(session, 'after_transaction_end')
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                session.expire_all()
+                session.begin_nested()
+
+        return session
+
+    return scoped_session(make_session)
+
+
+class TransactionalTestCase(unittest.TestCase):
+    """Gives each test a fresh app whose database work is rolled back."""
+
+    def setUp(self):
+        engine = setup_database()
+        self.connection = engine.connect()
+        self.transaction = self.connection.begin()
+        self._session = db.session
+        db.session = transactional_session(self.connection)
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': str(engine.url),
+            'DB_SCHEMA_MODE': 'fast',
+        })
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        db.session.remove()
+        db.session = self._session
+        # the session leaves its SAVEPOINT open on the connection, closing
+        # the connection rolls back the outer transaction and everything in it
+        self.connection.close()
+        invalidate_question_counts()
+        db.get_engine(self.app).dispose()
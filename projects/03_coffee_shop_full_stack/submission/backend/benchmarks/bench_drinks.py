@@ -0,0 +1,84 @@
+'''
+Drink serialization benchmark
+
+compares the old path (recipe stored as text, json.loads on every short()
+/ long() call) with the JSON column and projections of the Drink model,
+reloading the drinks from a fresh session on every pass as each /drinks
+request does; cross-request reuse comes from the response cache, not
+from the projections, so it is not measured here
+
+usage (from backend/): python benchmarks/bench_drinks.py [drinks] [passes]
+'''
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from src.database.models import db, Drink
+
+RECIPE = [
+    {'name': 'milk', 'color': 'grey', 'parts': 1},
+    {'name': 'coffee', 'color': 'brown', 'parts': 2},
+    {'name': 'foam', 'color': 'white', 'parts': 1}
+]
+
+
+# the old model, mapped onto the same table with the recipe as text
+class LegacyDrink(declarative_base()):
+    __tablename__ = 'drink'
+    id = Column(Integer, primary_key=True)
+    title = Column(String(80))
+    recipe = Column(String(180))
+
+    def short(self):
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        return {'id': self.id, 'title': self.title, 'recipe': short_recipe}
+
+    def long(self):
+        return {'id': self.id, 'title': self.title, 'recipe': json.loads(self.recipe)}
+
+
+def legacy_drinks():
+    db.session.remove()
+    return db.session.query(LegacyDrink).order_by(LegacyDrink.id).all()
+
+
+def drinks():
+    db.session.remove()
+    return Drink.query.order_by(Drink.id).all()
+
+
+def run(label, fn, n, passes):
+    started = time.perf_counter()
+    for _ in range(passes):
+        fn()
+    elapsed = time.perf_counter() - started
+    print('%-22s %12.0f drinks/s' % (label, n * passes / elapsed))
+
+
+def main(n, passes):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Drink(title='drink %d' % i, recipe=RECIPE) for i in range(n))
+        db.session.commit()
+
+        print('%d drinks x %d passes, reloaded each pass' % (n, passes))
+        run('legacy short()', lambda: [drink.short() for drink in legacy_drinks()], n, passes)
+        run('model short()', lambda: [drink.short() for drink in drinks()], n, passes)
+        run('legacy long()', lambda: [drink.long() for drink in legacy_drinks()], n, passes)
+        run('model long()', lambda: [drink.long() for drink in drinks()], n, passes)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [10000, 10][len(args):]))
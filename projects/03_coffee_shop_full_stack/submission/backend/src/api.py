@@ -1,17 +1,32 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, setup_db, Drink, on_drinks_changed
+from .auth.auth import AuthError, requires_auth, token_cache
+from fsnd_shared.streaming import wants_stream, stream_json, STREAM_BATCH_SIZE
+from .cache import VersionedResponseCache, store_from_env
 
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
+'''
+the public drinks listing is served from precomputed bytes, every
+committed drink write bumps the version and orphans the cached body
+set DRINKS_CACHE_REDIS_URL to share the cache between workers
+'''
+drinks_cache = VersionedResponseCache(store_from_env())
+on_drinks_changed(lambda: drinks_cache.bump('drinks'))
+
+# cache counters are exported next to the request metrics at /metrics
+request_metrics = app.extensions['request_metrics']
+request_metrics.register_stats('drinks_cache', drinks_cache.stats)
+request_metrics.register_stats('token_cache', token_cache.stats)
+
 '''
 uncomment the following line to initialize the database
 !! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
@@ -27,21 +42,49 @@ uncomment the following line to initialize the database
     returns status code 200 and json {"success": True, "drinks": drinks}
     where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+    with ?stream=1 the same body is streamed row by row
+    responses carry a strong ETag, If-None-Match answers 304
 '''
 
 
+'''
+stream_drinks()
+    streams {"success": True, "drinks": [...]} straight off the cursor
+'''
+def stream_drinks():
+    drinks = Drink.query.order_by(Drink.id) \
+        .execution_options(stream_results=True) \
+        .yield_per(STREAM_BATCH_SIZE)
+    return stream_json(
+        {"success": True},
+        "drinks",
+        (drink.long() for drink in drinks)
+    )
+
+
+def build_drinks_body():
+    drinks = [drink.long() for drink in Drink.query.order_by(Drink.id)]
+    with request_metrics.serializing():
+        return json.dumps({
+            "success": True,
+            "drinks": drinks
+        }).encode('utf-8')
+
+
 @app.route('/drinks', methods=['GET'])
 def get_drinks():
+    if wants_stream(request):
+        return stream_drinks()
     try:
-        drinks = []
-        for drink in Drink.query.all():
-            drinks.append(drink.long())
-        return jsonify({
-            "success": True,
-            "drinks": drinks
-        })
+        etag, body = drinks_cache.get_or_build('drinks', build_drinks_body)
     except Exception as e:
         abort(404)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # let clients and proxies keep the body but revalidate every time
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 '''
@@ -51,12 +94,15 @@ def get_drinks():
     returns status code 200 and json {"success": True, "drinks": drinks}
     where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+    with ?stream=1 the same body is streamed row by row
 '''
 
 
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth('get:drinks-detail')
 def get_drinks_detail(payload):
+    if wants_stream(request):
+        return stream_drinks()
     try:
         drinks = []
         for drink in Drink.query.all():
@@ -87,10 +133,10 @@ def create_drink(payload):
         data = request.get_json()
         title = data.get('title', None)
         recipe = data.get('recipe', None)
-        drink = Drink(title=title, recipe=json.dumps(recipe))
+        drink = Drink(title=title, recipe=recipe)
         drink.insert()
-        drink = Drink.query.filter(Drink.title == title).one_or_none()
-        drink = drink.long()
+        # insert() flushed the row, its id and projections are already known
+        drink = [drink.long()]
         return jsonify({
             'success': True,
             'drinks': drink
@@ -119,7 +165,7 @@ def edit_drink(payload, id):
         data = request.get_json()
         drink = Drink.query.get(id)
         drink.title = data.get('title', None)
-        drink.recipe = json.dumps(data.get('recipe', None))
+        drink.recipe = data.get('recipe', None)
         drink.update()
         drink = [drink.long()]
         return jsonify({
@@ -130,6 +176,80 @@ def edit_drink(payload, id):
         abort(422)
 
 
+'''
+    POST /drinks/bulk
+        it should create every drink in the request in one transaction
+        it should require the 'post:drinks' permission
+        the body is {"drinks": [{"title": ..., "recipe": ...}, ...]}
+    returns status code 200 and json {"success": True, "drinks": drinks}
+    where drinks is the list of created drinks in request order
+        or 422 and nothing written if any drink is rejected
+'''
+
+
+MAX_BULK_DRINKS = 1000
+
+
+def bulk_items(data):
+    items = (data or {}).get('drinks')
+    if not isinstance(items, list) or not items or len(items) > MAX_BULK_DRINKS:
+        abort(422)
+    if not all(isinstance(item, dict) for item in items):
+        abort(422)
+    return items
+
+
+@app.route('/drinks/bulk', methods=['POST'])
+@requires_auth('post:drinks')
+def create_drinks(payload):
+    items = bulk_items(request.get_json())
+    try:
+        drinks = Drink.insert_many([
+            Drink(title=item.get('title'), recipe=item.get('recipe'))
+            for item in items
+        ])
+    except Exception as e:
+        abort(422)
+    return jsonify({
+        "success": True,
+        "drinks": [drink.long() for drink in drinks]
+    })
+
+
+'''
+    PATCH /drinks/bulk
+        it should update every drink in the request in one transaction
+        it should require the 'patch:drinks' permission
+        the body is {"drinks": [{"id": ..., "title": ..., "recipe": ...}, ...]}
+        title and recipe are optional, only the given fields change
+    returns status code 200 and json {"success": True, "drinks": drinks}
+    where drinks is the list of updated drinks ordered by id
+        or 404 if any id is not found, 422 if any update is rejected
+'''
+
+
+@app.route('/drinks/bulk', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def edit_drinks(payload):
+    changes = {}
+    for item in bulk_items(request.get_json()):
+        if not isinstance(item.get('id'), int) or item['id'] in changes:
+            abort(422)
+        changes[item['id']] = {
+            key: item[key] for key in ('title', 'recipe') if key in item
+        }
+    try:
+        drinks = Drink.update_many(changes)
+    except Exception as e:
+        abort(422)
+    if drinks is None:
+        abort(404)
+    return jsonify({
+        "success": True,
+        "drinks": [drink.long() for drink in drinks]
+    })
+
+
 '''
     DELETE /drinks/<id>
         where <id> is the existing model id
@@ -2,13 +2,23 @@ import json
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
 import os
 
+from .jwks import JWKSKeyStore
+from .token_cache import VerifiedTokenCache
+
 AUTH0_DOMAIN = 'dev-tkeyes25.us.auth0.com'
 ALGORITHMS = 'RS256'
 API_AUDIENCE = 'drinks'
 
+# process-wide signing key cache, tests can swap the fetcher for a local one
+jwks_store = JWKSKeyStore(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+# payloads of tokens that already passed signature and claims checks
+token_cache = VerifiedTokenCache(
+    maxsize=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 1024))
+)
+
 # AuthError Exception
 '''
 AuthError Exception
@@ -91,6 +101,8 @@ implement verify_decode_jwt(token) method
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        keys come from jwks_store, which only goes to the network
+        when the cached key set is stale or the kid is unknown
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -101,30 +113,18 @@ implement verify_decode_jwt(token) method
 
 
 def verify_decode_jwt(token):
-    # GET THE PUBLIC KEY FROM AUTH0
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-
     # GET THE DATA IN THE HEADER
     unverified_header = jwt.get_unverified_header(token)
 
     # CHOOSE OUR KEY
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    # GET THE PUBLIC KEY FROM THE CACHED AUTH0 KEY SET
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
 
     # Finally, verify!!!
     if rsa_key:
@@ -169,6 +169,7 @@ def verify_decode_jwt(token):
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        unless the token is already in token_cache
     it should use the check_permissions method validate claims and check
     the requested permission
     return the decorator which passes the decoded payload
@@ -181,7 +182,10 @@ def requires_auth(permission=''):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = verify_decode_jwt(token)
+                token_cache.put(token, payload)
             check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
         return wrapper
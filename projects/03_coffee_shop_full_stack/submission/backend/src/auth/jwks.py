@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+
+'''
+urlopen_fetcher(url)
+    default JWKS fetcher, downloads and parses the key set at url
+    any callable with the same signature can be handed to JWKSKeyStore,
+    e.g. a function returning a local dict in tests
+'''
+
+
+def urlopen_fetcher(url, timeout=5):
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+'''
+JWKSKeyStore
+    process-wide cache of the signing keys published at a JWKS url
+
+    keys are parsed once per fetch and indexed by kid
+    the key set is considered fresh for `ttl` seconds and is refreshed
+    by a background thread before it goes stale
+    refetches on request (stale set, unknown kid) happen at most once every
+    `min_refetch_interval` seconds so bad tokens or a down issuer can't
+    cause fetch storms; while one request fetches, others with keys to
+    serve don't wait for it; until a key set has been fetched every
+    request tries, one at a time
+    if a refresh fails the previously fetched keys keep being served
+'''
+
+
+class JWKSKeyStore:
+    def __init__(self, jwks_url, fetcher=urlopen_fetcher, ttl=600,
+                 min_refetch_interval=30, background_refresh=True):
+        self.jwks_url = jwks_url
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.background_refresh = background_refresh
+
+        self._keys = {}
+        self._fetched_at = None
+        # never attempted; monotonic() may be small right after a boot
+        self._last_attempt = float('-inf')
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    '''
+    get_key(kid)
+        returns the rsa key for kid, or None if the issuer doesn't publish it
+    '''
+    def get_key(self, kid):
+        if self._fetched_at is None or self._is_stale():
+            self.refresh(force=False)
+            self._start_refresher()
+
+        key = self._keys.get(kid)
+        if key is None and self._can_refetch():
+            self.refresh(force=False)
+            key = self._keys.get(kid)
+        return key
+
+    '''
+    refresh(force=True)
+        fetches the key set and swaps it in atomically
+        with force=False the call is a no-op inside the rate limit window,
+        or while another thread is fetching and there are keys to serve
+    '''
+    def refresh(self, force=True):
+        if not self._lock.acquire(blocking=force or not self._keys):
+            return False
+        try:
+            if not force and not self._can_refetch():
+                return False
+            self._last_attempt = time.monotonic()
+            try:
+                jwks = self.fetcher(self.jwks_url)
+            except Exception:
+                # keep serving the last known keys, only fail if we have none
+                if not self._keys:
+                    raise
+                # and treat them as fresh until the next attempt is allowed
+                self._fetched_at = (
+                    self._last_attempt - self.ttl + self.min_refetch_interval
+                )
+                return False
+            self._keys = self._parse(jwks)
+            self._fetched_at = time.monotonic()
+            return True
+        finally:
+            self._lock.release()
+
+    def stop(self):
+        self._stop.set()
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = float('-inf')
+
+    def _is_stale(self):
+        return time.monotonic() - self._fetched_at >= self.ttl
+
+    # with no keys every request fails anyway, so don't hold back a retry
+    def _can_refetch(self):
+        if not self._keys:
+            return True
+        elapsed = time.monotonic() - self._last_attempt
+        return elapsed >= self.min_refetch_interval
+
+    def _start_refresher(self):
+        if not self.background_refresh or self._refresher is not None:
+            return
+        self._refresher = threading.Thread(
+            target=self._refresh_loop,
+            name='jwks-refresh',
+            daemon=True
+        )
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        # refresh a little before the ttl runs out so requests never wait
+        interval = max(self.ttl * 0.8, 1)
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _parse(jwks):
+        keys = {}
+        for key in jwks.get('keys', []):
+            if 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use'),
+                'n': key['n'],
+                'e': key['e']
+            }
+        return keys
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# seconds a body cached in process is served; versions are per process, so
+# this bounds how long other workers serve a listing after a write
+DRINKS_CACHE_TTL = int(os.environ.get('DRINKS_CACHE_TTL', 60))
+
+
+'''
+MemoryStore
+    in-process LRU of cached bodies plus named version counters
+    bodies expire after `ttl` seconds, counters are never evicted
+'''
+
+
+class MemoryStore:
+    def __init__(self, maxsize=128, ttl=DRINKS_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def version(self, name):
+        return self._counters.get(name, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+
+'''
+RedisStore
+    same interface on a redis-py compatible client, so every worker
+    shares the cached bodies and sees the same version counters; set
+    DRINKS_CACHE_REDIS_URL when running more than one worker
+    old versions simply expire after `ttl` seconds
+'''
+
+
+class RedisStore:
+    def __init__(self, client, prefix='coffee:cache:', ttl=86400):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def version(self, name):
+        return int(self.client.get(self.prefix + 'version:' + name) or 0)
+
+    def incr(self, name):
+        return self.client.incr(self.prefix + 'version:' + name)
+
+
+def store_from_env():
+    url = os.environ.get('DRINKS_CACHE_REDIS_URL')
+    if not url:
+        return MemoryStore()
+    import redis
+    return RedisStore(redis.Redis.from_url(url))
+
+
+'''
+VersionedResponseCache
+    caches serialized response bodies under `<name>:v<version>`
+
+    writers call bump(name) after committing, which makes every body built
+    for an older version unreachable; readers never need to invalidate
+    the etag is a strong validator derived from the body bytes, hashed
+    once when the body is built and stored in front of it
+'''
+
+
+class VersionedResponseCache:
+    def __init__(self, store=None):
+        self.store = store if store is not None else MemoryStore()
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, name):
+        self.store.incr(name)
+
+    '''
+    get_or_build(name, build)
+        returns (etag, body) for the current version of name, calling
+        build() -> bytes only on a miss
+    '''
+    def get_or_build(self, name, build):
+        # read the version before building, a write that lands while we
+        # build bumps it again and the next request rebuilds
+        key = '{}:v{}'.format(name, self.store.version(name))
+        entry = self.store.get(key)
+        if entry is None:
+            self.misses += 1
+            body = build()
+            etag = hashlib.sha256(body).hexdigest()
+            self.store.set(key, etag.encode('ascii') + b'\n' + body)
+            return etag, body
+        self.hits += 1
+        etag, _, body = entry.partition(b'\n')
+        return etag.decode('ascii'), body
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -1,14 +1,30 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, JSON
+from sqlalchemy.orm import reconstructor, validates
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_shared import db_bootstrap, request_metrics
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+# callbacks run after a committed drink write, e.g. to bump a cache version
+drink_watchers = []
+
+
+def on_drinks_changed(callback):
+    drink_watchers.append(callback)
+    return callback
+
+
+def drinks_changed():
+    for callback in drink_watchers:
+        callback()
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -16,8 +32,11 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db_bootstrap.configure(app)
     db.app = app
     db.init_app(app)
+    db_bootstrap.instrument(app, db)
+    request_metrics.instrument(app, db)
 
 '''
 db_drop_and_create_all()
@@ -38,46 +57,132 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients blob - stored as native json, decoded by the driver
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    recipe = Column(JSON, nullable=False)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._projections = {}
 
     '''
-    short()
-        short form representation of the Drink model
+    projections are cached on the instance and rebuilt only after a write
+    (or an assignment to title / recipe); an instance lives for one request,
+    so this saves repeat walks of the recipe within it, while reuse across
+    requests comes from the /drinks response cache (src/cache.py)
     '''
-    def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+    @reconstructor
+    def _init_projections(self):
+        self._projections = {}
+
+    @validates('title', 'recipe')
+    def _invalidate_projections(self, key, value):
+        if key == 'recipe' and isinstance(value, dict):
+            # a single ingredient is stored as a one item recipe
+            value = [value]
+        self._projections = {}
+        return value
+
+    def _short(self):
+        recipe = self.recipe or []
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        return {
+            'id': self.id,
+            'title': self.title,
+            'recipe': [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+        }
+
+    def _long(self):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.recipe
         }
 
+    def _refresh_projections(self):
+        self._projections = {'short': self._short(), 'long': self._long()}
+
+    '''
+    short()
+        short form representation of the Drink model
+    '''
+    def short(self):
+        if 'short' not in self._projections:
+            self._projections['short'] = self._short()
+        return self._projections['short']
+
     '''
     long()
         long form representation of the Drink model
     '''
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        if 'long' not in self._projections:
+            self._projections['long'] = self._long()
+        return self._projections['long']
 
     '''
     insert()
         inserts a new model into a database
         the model must have a unique name
         the model must have a unique id or null id
+        the id is taken from the flush, long() needs no reload afterwards
         EXAMPLE
             drink = Drink(title=req_title, recipe=req_recipe)
             drink.insert()
     '''
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        self._refresh_projections()
         db.session.commit()
+        drinks_changed()
+
+    '''
+    insert_many(drinks)
+        inserts a list of new drinks in one transaction, ids come back from
+        the flush so the projections are built without reloading the rows
+        EXAMPLE
+            drinks = Drink.insert_many([Drink(title=t, recipe=r) for t, r in rows])
+    '''
+    @classmethod
+    def insert_many(cls, drinks):
+        try:
+            db.session.add_all(drinks)
+            db.session.flush()
+            for drink in drinks:
+                drink._refresh_projections()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        drinks_changed()
+        return drinks
+
+    '''
+    update_many(changes)
+        applies {id: {'title': ..., 'recipe': ...}} to existing drinks in one
+        transaction, the drinks are loaded with a single query
+        returns the updated drinks, or None when any id does not exist
+    '''
+    @classmethod
+    def update_many(cls, changes):
+        drinks = cls.query.filter(cls.id.in_(list(changes))).all()
+        if len(drinks) != len(changes):
+            return None
+        try:
+            for drink in drinks:
+                for key, value in changes[drink.id].items():
+                    setattr(drink, key, value)
+            db.session.flush()
+            for drink in drinks:
+                drink._refresh_projections()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        drinks_changed()
+        return sorted(drinks, key=lambda drink: drink.id)
 
     '''
     delete()
@@ -92,8 +197,9 @@ class Drink(db.Model):
             db.session.delete(self)
             db.session.commit()
         except Exception as e:
-            db.rollback()
+            db.session.rollback()
             raise
+        drinks_changed()
 
     '''
     update()
@@ -105,7 +211,10 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
+        db.session.flush()
+        self._refresh_projections()
         db.session.commit()
+        drinks_changed()
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
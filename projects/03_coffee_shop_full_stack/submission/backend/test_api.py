@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+# setup_db() binds database_path when src.api is imported, point it at a
+# throwaway file so the tests never touch src/database/database.db
+from src.database import models
+
+models.database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
+from src import api
+from src.database.models import Drink, db_drop_and_create_all
+
+RECIPE = [{'name': 'water', 'color': 'blue', 'parts': 1}]
+
+
+class BulkDrinksTestCase(unittest.TestCase):
+    """Bulk writes are all or nothing and bump the /drinks cache version."""
+
+    def setUp(self):
+        db_drop_and_create_all()
+        self.client = api.app.test_client()
+        # payloads seeded into token_cache stand in for verified Auth0 tokens
+        self.addCleanup(api.token_cache.clear)
+        self.grant('barista', 'get:drinks-detail')
+        self.grant('manager', 'get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks')
+
+    def grant(self, token, *permissions):
+        api.token_cache.put(token, {
+            'exp': time.time() + 3600,
+            'permissions': list(permissions)
+        })
+
+    def send(self, method, body, token='manager'):
+        return self.client.open(
+            '/drinks/bulk',
+            method=method,
+            json=body,
+            headers={'Authorization': 'Bearer ' + token}
+        )
+
+    def seed(self, *titles):
+        res = self.send('POST', {'drinks': [{'title': title, 'recipe': RECIPE} for title in titles]})
+        self.assertEqual(res.status_code, 200)
+        return [drink['id'] for drink in json.loads(res.data)['drinks']]
+
+    def titles(self):
+        return sorted(drink.title for drink in Drink.query.all())
+
+    def version(self):
+        return api.drinks_cache.store.version('drinks')
+
+    def test_create_drinks(self):
+        version = self.version()
+        res = self.send('POST', {'drinks': [
+            {'title': 'Water', 'recipe': RECIPE},
+            {'title': 'Tea', 'recipe': RECIPE}
+        ]})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([drink['title'] for drink in data['drinks']], ['Water', 'Tea'])
+        self.assertTrue(all(drink['id'] for drink in data['drinks']))
+        self.assertEqual(self.version(), version + 1)
+
+    def test_create_drinks_changes_public_listing(self):
+        first = self.client.get('/drinks')
+        self.seed('Water')
+        second = self.client.get('/drinks')
+        self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertEqual(json.loads(second.data)['drinks'][0]['title'], 'Water')
+
+    def test_create_drinks_rolls_back_on_duplicate_title(self):
+        self.seed('Water')
+        version = self.version()
+        res = self.send('POST', {'drinks': [
+            {'title': 'Tea', 'recipe': RECIPE},
+            {'title': 'Water', 'recipe': RECIPE}
+        ]})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(self.titles(), ['Water'])
+        self.assertEqual(self.version(), version)
+
+    def test_create_drinks_rejects_empty_batch(self):
+        self.assertEqual(self.send('POST', {'drinks': []}).status_code, 422)
+        self.assertEqual(self.send('POST', {'drinks': ['Water']}).status_code, 422)
+
+    def test_create_drinks_requires_permission(self):
+        res = self.send('POST', {'drinks': [{'title': 'Water', 'recipe': RECIPE}]}, token='barista')
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(self.titles(), [])
+
+    def test_edit_drinks(self):
+        water, tea = self.seed('Water', 'Tea')
+        version = self.version()
+        res = self.send('PATCH', {'drinks': [
+            {'id': tea, 'title': 'Green Tea'},
+            {'id': water, 'recipe': [{'name': 'ice', 'color': 'white', 'parts': 2}]}
+        ]})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([drink['id'] for drink in data['drinks']], [water, tea])
+        self.assertEqual(data['drinks'][0]['recipe'][0]['name'], 'ice')
+        self.assertEqual(self.titles(), ['Green Tea', 'Water'])
+        self.assertEqual(self.version(), version + 1)
+
+    def test_edit_drinks_404_on_unknown_id(self):
+        water, = self.seed('Water')
+        res = self.send('PATCH', {'drinks': [
+            {'id': water, 'title': 'Sparkling Water'},
+            {'id': water + 100, 'title': 'Tea'}
+        ]})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(self.titles(), ['Water'])
+
+    def test_edit_drinks_422_on_duplicate_or_non_int_id(self):
+        water, = self.seed('Water')
+        for items in (
+            [{'id': water, 'title': 'A'}, {'id': water, 'title': 'B'}],
+            [{'id': str(water), 'title': 'A'}],
+            [{'title': 'A'}]
+        ):
+            self.assertEqual(self.send('PATCH', {'drinks': items}).status_code, 422)
+        self.assertEqual(self.titles(), ['Water'])
+
+    def test_edit_drinks_rolls_back_on_duplicate_title(self):
+        water, tea = self.seed('Water', 'Tea')
+        version = self.version()
+        res = self.send('PATCH', {'drinks': [
+            {'id': water, 'title': 'Coffee'},
+            {'id': tea, 'title': 'Coffee'}
+        ]})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(self.titles(), ['Tea', 'Water'])
+        self.assertEqual(self.version(), version)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
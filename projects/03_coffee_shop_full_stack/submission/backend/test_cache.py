@@ -0,0 +1,51 @@
+import hashlib
+import unittest
+
+from src.cache import MemoryStore, VersionedResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class VersionedResponseCacheTestCase(unittest.TestCase):
+    """Bodies are built once per version and expire from the memory store."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = VersionedResponseCache(MemoryStore(ttl=60, clock=self.clock))
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return '{{"build": {}}}'.format(self.builds).encode('utf-8')
+
+    def test_hits_return_the_stored_etag(self):
+        etag, body = self.cache.get_or_build('drinks', self.build)
+        self.assertEqual(etag, hashlib.sha256(body).hexdigest())
+        self.assertEqual(self.cache.get_or_build('drinks', self.build), (etag, body))
+        self.assertEqual(self.builds, 1)
+
+    def test_bump_rebuilds(self):
+        self.cache.get_or_build('drinks', self.build)
+        self.cache.bump('drinks')
+        _, body = self.cache.get_or_build('drinks', self.build)
+        self.assertEqual(body, b'{"build": 2}')
+
+    def test_bodies_expire(self):
+        self.cache.get_or_build('drinks', self.build)
+        self.clock.now += 59
+        self.cache.get_or_build('drinks', self.build)
+        self.assertEqual(self.builds, 1)
+        self.clock.now += 1
+        self.cache.get_or_build('drinks', self.build)
+        self.assertEqual(self.builds, 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from src.auth.jwks import JWKSKeyStore, urlopen_fetcher
+
+
+def jwks(*kids):
+    return {'keys': [
+        {'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': 'n-' + kid, 'e': 'AQAB'}
+        for kid in kids
+    ]}
+
+
+class StandInIssuer:
+    '''
+    pluggable fetcher standing in for the Auth0 JWKS endpoint
+    serves `keys`, or raises while `down` is set, and counts every call
+    '''
+    def __init__(self, *kids):
+        self.keys = jwks(*kids)
+        self.down = False
+        self.fetches = 0
+
+    def __call__(self, url):
+        self.fetches += 1
+        if self.down:
+            raise OSError('issuer unavailable')
+        return self.keys
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """Key lookups go to the issuer only when they have to."""
+
+    def setUp(self):
+        self.issuer = StandInIssuer('k1')
+        self.store = JWKSKeyStore(
+            'https://issuer.test/.well-known/jwks.json',
+            fetcher=self.issuer,
+            ttl=600,
+            min_refetch_interval=30,
+            background_refresh=False
+        )
+
+    def expire(self):
+        self.store._fetched_at -= self.store.ttl
+        self.store._last_attempt -= self.store.min_refetch_interval
+
+    def test_keys_are_fetched_once(self):
+        for _ in range(5):
+            self.assertEqual(self.store.get_key('k1')['n'], 'n-k1')
+        self.assertEqual(self.issuer.fetches, 1)
+
+    def test_stale_keys_are_refreshed(self):
+        self.store.get_key('k1')
+        self.issuer.keys = jwks('k2')
+        self.expire()
+        self.assertIsNotNone(self.store.get_key('k2'))
+        self.assertEqual(self.issuer.fetches, 2)
+
+    def test_failed_refresh_serves_stale_keys_without_refetching(self):
+        self.store.get_key('k1')
+        self.issuer.down = True
+        self.expire()
+        for _ in range(5):
+            self.assertEqual(self.store.get_key('k1')['n'], 'n-k1')
+        self.assertEqual(self.issuer.fetches, 2)
+
+    def test_failed_refresh_retries_after_interval(self):
+        self.store.get_key('k1')
+        self.issuer.down = True
+        self.expire()
+        self.store.get_key('k1')
+        self.issuer.down = False
+        self.store._fetched_at -= self.store.min_refetch_interval
+        self.store._last_attempt -= self.store.min_refetch_interval
+        self.store.get_key('k1')
+        self.assertEqual(self.issuer.fetches, 3)
+
+    def test_unknown_kids_are_rate_limited(self):
+        self.store.get_key('k1')
+        self.store._last_attempt -= self.store.min_refetch_interval
+        for kid in ('x1', 'x2', 'x3'):
+            self.assertIsNone(self.store.get_key(kid))
+        self.assertEqual(self.issuer.fetches, 2)
+
+    def test_unreachable_issuer_is_retried_until_keys_arrive(self):
+        self.issuer.down = True
+        for _ in range(3):
+            with self.assertRaises(OSError):
+                self.store.get_key('k1')
+        self.issuer.down = False
+        self.assertEqual(self.store.get_key('k1')['n'], 'n-k1')
+        self.assertEqual(self.issuer.fetches, 4)
+
+    def test_first_fetch_right_after_boot(self):
+        # monotonic() counts from boot, so it can be below min_refetch_interval
+        with mock.patch('src.auth.jwks.time.monotonic', return_value=12.0):
+            self.assertEqual(self.store.get_key('k1')['n'], 'n-k1')
+            self.store.clear()
+            self.assertEqual(self.store.get_key('k1')['n'], 'n-k1')
+        self.assertEqual(self.issuer.fetches, 2)
+
+    def test_requests_with_keys_do_not_wait_for_a_refresh(self):
+        self.store.get_key('k1')
+        self.expire()
+        with self.store._lock:
+            started = time.monotonic()
+            self.assertIsNotNone(self.store.get_key('k1'))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.issuer.fetches, 1)
+
+
+class JWKSHandler(BaseHTTPRequestHandler):
+    body = json.dumps(jwks('k1')).encode('utf-8')
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class UrlopenFetcherTestCase(unittest.TestCase):
+    """The default fetcher against a local HTTP stand-in."""
+
+    def test_fetches_key_set(self):
+        server = HTTPServer(('127.0.0.1', 0), JWKSHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(server.server_port)
+        store = JWKSKeyStore(url, fetcher=urlopen_fetcher, background_refresh=False)
+        self.assertEqual(store.get_key('k1')['n'], 'n-k1')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from src.auth import auth
+from src.auth.token_cache import VerifiedTokenCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """Verified payloads are kept until exp, in a bounded LRU."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = VerifiedTokenCache(maxsize=2, clock=self.clock)
+
+    def payload(self, ttl=60, **claims):
+        return dict(claims, exp=self.clock.now + ttl)
+
+    def test_entries_expire_at_exp(self):
+        payload = self.payload(ttl=60)
+        self.cache.put('token', payload)
+        self.clock.now += 59
+        self.assertEqual(self.cache.get('token'), payload)
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get('token'))
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_tokens_without_exp_are_not_cached(self):
+        self.cache.put('token', {'permissions': ['get:drinks-detail']})
+        self.cache.put('expired', self.payload(ttl=-1))
+        self.assertIsNone(self.cache.get('token'))
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for token in ('a', 'b'):
+            self.cache.put(token, self.payload())
+        self.cache.get('a')
+        self.cache.put('c', self.payload())
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+        self.assertEqual(stats['hit_rate'], 0.75)
+
+    def test_raw_token_is_not_kept(self):
+        self.cache.put('secret-token', self.payload())
+        self.assertNotIn('secret-token', self.cache._entries)
+
+
+class RequiresAuthCacheTestCase(unittest.TestCase):
+    """A cached payload skips verification but not the permission check."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.addCleanup(auth.token_cache.clear)
+        auth.token_cache.put('cached', {
+            'exp': auth.token_cache.clock() + 60,
+            'permissions': ['get:drinks-detail']
+        })
+        patcher = mock.patch.object(auth, 'verify_decode_jwt', side_effect=AssertionError('verified again'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, permission):
+        view = auth.requires_auth(permission)(lambda payload: payload)
+        with self.app.test_request_context(headers={'Authorization': 'Bearer cached'}):
+            return view()
+
+    def test_cached_payload_is_used(self):
+        self.assertIn('get:drinks-detail', self.call('get:drinks-detail')['permissions'])
+
+    def test_cached_payload_without_permission_is_rejected(self):
+        with self.assertRaises(auth.AuthError) as raised:
+            self.call('post:drinks')
+        self.assertEqual(raised.exception.status_code, 401)
+        self.assertEqual(raised.exception.error['code'], 'invalid_permissions')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
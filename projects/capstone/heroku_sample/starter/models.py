@@ -1,7 +1,10 @@
-from sqlalchemy import Column, String, create_engine
+import os
+from sqlalchemy import Column, String, Integer, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_shared import db_bootstrap
+
 database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
@@ -9,13 +12,18 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    there are no migrations yet, so the tables are created on the first
+    boot of a deploy unless DB_SCHEMA_MODE says otherwise
+    (see fsnd_shared.db_bootstrap)
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db_bootstrap.configure(app)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    db_bootstrap.instrument(app, db)
+    db_bootstrap.prepare_schema(app, db, default='ensure')
 
 
 '''
@@ -0,0 +1,9 @@
+'''
+fsnd_shared
+    helpers shared by the Flask apps in this repo, installed into each
+    app's environment from its requirements.txt (-e path to this directory)
+
+    db_bootstrap     engine options, pool metrics, /health/db, schema modes
+    request_metrics  per-endpoint query and latency metrics at /metrics
+    streaming        opt-in streamed JSON listings (?stream=1)
+'''
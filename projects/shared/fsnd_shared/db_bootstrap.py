@@ -0,0 +1,422 @@
+'''
+db_bootstrap
+    shared database setup for the flask apps in this repo
+
+    engine_options(uri)      pool settings read from the environment
+    configure(app)           puts them in SQLALCHEMY_ENGINE_OPTIONS
+    instrument(app, db)      pool metrics, statement timing, slow query
+                             log and /health/db
+    prepare_schema(app, db)  startup schema handling, see DB_SCHEMA_MODE
+
+    environment (all optional)
+        DB_POOL_SIZE             connections kept open (5)
+        DB_MAX_OVERFLOW          extra connections under burst (10)
+        DB_POOL_TIMEOUT          seconds to wait for a connection (30)
+        DB_POOL_RECYCLE          reconnect connections older than this (1800)
+        DB_POOL_PRE_PING         test connections on checkout (1)
+        DB_STATEMENT_TIMEOUT_MS  postgres statement_timeout, 0 is off (0)
+        DB_SLOW_QUERY_MS         log statements slower than this, 0 is off (500)
+        DB_SCHEMA_MODE           fast, verify, ensure or create (per app)
+        DB_SCHEMA_STAMP          stamp file for verify and ensure (in the temp dir)
+'''
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import event, exc, inspect, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+slow_query_log = logging.getLogger('db.slow_query')
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+'''
+PoolMetrics
+    counters fed by pool events, read by /health/db and metrics exporters
+'''
+
+
+class PoolMetrics(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.slow_queries = 0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            stats = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'slow_queries': self.slow_queries,
+            }
+        if isinstance(pool, QueuePool):
+            stats['size'] = pool.size()
+            stats['overflow'] = pool.overflow()
+            stats['idle'] = pool.checkedin()
+        return stats
+
+
+'''
+MeteredQueuePool
+    QueuePool that times how long callers wait for a connection, the pool
+    events only fire once a connection has been handed out
+'''
+
+
+class MeteredQueuePool(QueuePool):
+    metrics = None
+
+    def _timed(self, checkout):
+        started = time.perf_counter()
+        try:
+            connection = checkout()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    def connect(self):
+        return self._timed(super().connect)
+
+    # SQLAlchemy 1.3 engines check out through unique_connection()
+    def unique_connection(self):
+        return self._timed(super().unique_connection)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+'''
+engine_options(uri)
+    SQLAlchemy create_engine() keyword arguments for uri
+    sqlite keeps its own pool class, sizing only applies to server databases
+'''
+
+
+def engine_options(uri):
+    options = {
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', '1'),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+    }
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        return options
+    options.update({
+        'poolclass': MeteredQueuePool,
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+    })
+    statement_timeout = env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    # SQLAlchemy 1.3 still accepts postgres:// (Heroku's DATABASE_URL) and
+    # reports it as its own backend name
+    if statement_timeout and url.get_backend_name() in ('postgresql', 'postgres'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(statement_timeout)
+        }
+    return options
+
+
+def configure(app):
+    app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS',
+        engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    )
+
+
+def listen_pool(engine, metrics):
+    if isinstance(engine.pool, MeteredQueuePool):
+        engine.pool.metrics = metrics
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        with metrics._lock:
+            metrics.connects += 1
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkout()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        metrics.checkin()
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        with metrics._lock:
+            metrics.invalidations += 1
+
+
+'''
+StatementTimer
+    times every statement on one engine and hands (statement, seconds,
+    executemany) to each observer; the engine hooks are only installed
+    once something observes
+'''
+
+
+class StatementTimer(object):
+    def __init__(self, engine):
+        self.engine = engine
+        self.observers = []
+
+    def observe(self, observer):
+        if not self.observers:
+            self.listen()
+        self.observers.append(observer)
+
+    def listen(self):
+        @event.listens_for(self.engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+        @event.listens_for(self.engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['query_started'].pop()
+            for observer in self.observers:
+                observer(statement, elapsed, executemany)
+
+        # a failed statement never reaches after_cursor_execute
+        @event.listens_for(self.engine, 'handle_error')
+        def on_error(context):
+            started = context.connection.info.get('query_started') if context.connection else None
+            if started:
+                started.pop()
+
+
+def slow_query_logger(metrics, threshold_ms):
+    threshold = threshold_ms / 1000.0
+
+    def log_slow_query(statement, elapsed, executemany):
+        if elapsed >= threshold:
+            with metrics._lock:
+                metrics.slow_queries += 1
+            slow_query_log.warning(
+                'slow query %.1fms: %s', elapsed * 1000, ' '.join(statement.split())[:1000]
+            )
+
+    return log_slow_query
+
+
+'''
+instrument(app, db)
+    attaches pool metrics, a StatementTimer and the slow query log to the
+    app's engine and registers GET /health/db
+    the metrics are kept in app.extensions['db_pool_metrics'], the timer in
+    app.extensions['db_statement_timer']
+'''
+
+
+def instrument(app, db):
+    engine = db.get_engine(app)
+    metrics = PoolMetrics()
+    listen_pool(engine, metrics)
+    timer = StatementTimer(engine)
+    threshold_ms = env_int('DB_SLOW_QUERY_MS', 500)
+    if threshold_ms > 0:
+        timer.observe(slow_query_logger(metrics, threshold_ms))
+    app.extensions['db_pool_metrics'] = metrics
+    app.extensions['db_statement_timer'] = timer
+
+    '''
+    GET /health/db
+        runs SELECT 1 and reports its latency with the pool metrics
+    returns 200 {"status": "ok", ...} or 503 {"status": "unavailable", ...}
+    '''
+    def health_db():
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+        except exc.SQLAlchemyError as e:
+            return jsonify({
+                'status': 'unavailable',
+                'error': e.__class__.__name__,
+                'pool': metrics.snapshot(engine.pool)
+            }), 503
+        return jsonify({
+            'status': 'ok',
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+            'pool': metrics.snapshot(engine.pool)
+        })
+
+    app.add_url_rule('/health/db', 'health_db', health_db)
+    return metrics
+
+
+'''
+schema_fingerprint(metadata)
+    hash of the table and column names the models expect, computed without
+    touching the database
+'''
+
+
+def schema_fingerprint(metadata):
+    names = sorted(
+        '{}.{}'.format(table.name, column.name)
+        for table in metadata.sorted_tables
+        for column in table.columns
+    )
+    return hashlib.sha256('\n'.join(names).encode('utf-8')).hexdigest()
+
+
+def missing_columns(engine, metadata):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append(table.name)
+            continue
+        present = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(
+            '{}.{}'.format(table.name, column.name)
+            for column in table.columns if column.name not in present
+        )
+    return missing
+
+
+def stamp_path(engine):
+    path = os.environ.get('DB_SCHEMA_STAMP')
+    if path:
+        return path
+    key = hashlib.sha256(str(engine.url).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), 'schema-{}.stamp'.format(key))
+
+
+def stamp_matches(engine, metadata):
+    try:
+        with open(stamp_path(engine)) as stamp:
+            if stamp.read().strip() != schema_fingerprint(metadata):
+                return False
+    except OSError:
+        return False
+    # the stamp outlives the database (dropped and recreated under the same
+    # url), so check the tables are still there, one cheap lookup each
+    with engine.connect() as conn:
+        return all(
+            engine.dialect.has_table(conn, table.name, schema=table.schema)
+            for table in metadata.sorted_tables
+        )
+
+
+def write_stamp(engine, fingerprint):
+    path = stamp_path(engine)
+    tmp = '{}.{}'.format(path, os.getpid())
+    with open(tmp, 'w') as stamp:
+        stamp.write(fingerprint)
+    os.replace(tmp, path)
+
+
+'''
+verify_schema(engine, metadata)
+    reflects the database once and fails fast when a table or column the
+    models need is missing; the verified fingerprint is written to a stamp
+    file so later workers of the same deploy skip the reflection, and only
+    check that each table still exists
+'''
+
+
+def verify_schema(engine, metadata):
+    if stamp_matches(engine, metadata):
+        return False
+    missing = missing_columns(engine, metadata)
+    if missing:
+        raise RuntimeError(
+            'database schema is behind the models, run the migrations '
+            '(missing: {})'.format(', '.join(missing))
+        )
+    write_stamp(engine, schema_fingerprint(metadata))
+    return True
+
+
+'''
+ensure_schema(app, db)
+    for apps without migrations: db.create_all() then verify_schema() on
+    the first boot of a deploy, later workers find the stamp and the
+    tables and skip both
+'''
+
+
+def ensure_schema(app, db):
+    engine = db.get_engine(app)
+    if stamp_matches(engine, db.Model.metadata):
+        return False
+    db.create_all(app=app)
+    return verify_schema(engine, db.Model.metadata)
+
+
+'''
+prepare_schema(app, db, default='fast')
+    what setup_db does about the schema at startup, from DB_SCHEMA_MODE in
+    the app config or the environment, else `default`
+        fast    nothing, migrations own the schema
+        verify  verify_schema(), reflection at most once per deploy
+        ensure  ensure_schema(), create_all() at most once per deploy;
+                the default for apps that have no migrations yet
+        create  db.create_all() on every boot, for throwaway databases
+'''
+
+
+def prepare_schema(app, db, default='fast'):
+    mode = app.config.get('DB_SCHEMA_MODE') or os.environ.get('DB_SCHEMA_MODE', default)
+    if mode == 'fast':
+        return
+    if mode == 'verify':
+        verify_schema(db.get_engine(app), db.Model.metadata)
+    elif mode == 'ensure':
+        ensure_schema(app, db)
+    elif mode == 'create':
+        db.create_all(app=app)
+    else:
+        raise ValueError('unknown DB_SCHEMA_MODE {!r}'.format(mode))
@@ -0,0 +1,346 @@
+'''
+request_metrics
+    per-endpoint query count and latency metrics for the flask apps in
+    this repo, exposed at GET /metrics in the Prometheus text format
+
+    instrument(app, db)        hooks the app's requests, and its statements
+                               through db_bootstrap's StatementTimer
+    metrics.register_stats()   exports a stats() dict as gauges
+    metrics.serializing()      counts a block as serialization time
+
+    every request records
+        http_request_duration_seconds       total latency
+        http_request_db_queries             statements executed
+        http_request_db_seconds             time spent in the database
+        http_request_serialization_seconds  template rendering and JSON
+                                            encoding, minus any queries
+                                            they ran
+    labelled with the flask endpoint, plus http_requests_total by method
+    and status
+
+    a request that runs the same statement METRICS_N_PLUS_ONE times or
+    more is counted in http_request_n_plus_one_total and logged to
+    db.n_plus_one, that is almost always a lazy load inside a loop
+
+    GET /metrics answers 404 until METRICS_TOKEN is set, then requires
+    `Authorization: Bearer <token>`
+
+    environment or app config (all optional)
+        METRICS_TOKEN       bearer token for GET /metrics (unset, no endpoint)
+        METRICS_N_PLUS_ONE  repeats of one statement to flag, 0 is off (10)
+'''
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Response, abort, g, has_request_context, request
+
+n_plus_one_log = logging.getLogger('db.n_plus_one')
+
+SECONDS_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SERIALIZATION_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return ','.join('{}="{}"'.format(name, escape(value)) for name, value in sorted(values.items()))
+
+
+def number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+'''
+Histogram
+    Prometheus style histogram, bucket counts are made cumulative when
+    rendered
+'''
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, **label_values):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield '{}_bucket{{{}}} {}'.format(
+                name, labels(le=number(bound), **label_values), cumulative)
+        yield '{}_sum{{{}}} {}'.format(name, labels(**label_values), number(self.sum))
+        yield '{}_count{{{}}} {}'.format(name, labels(**label_values), self.count)
+
+
+class EndpointMetrics(object):
+    def __init__(self):
+        self.duration = Histogram(SECONDS_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db = Histogram(SECONDS_BUCKETS)
+        self.serialization = Histogram(SERIALIZATION_BUCKETS)
+        self.n_plus_one = 0
+
+
+HISTOGRAMS = (
+    ('http_request_duration_seconds', 'duration', 'Request latency.'),
+    ('http_request_db_queries', 'queries', 'Statements executed per request.'),
+    ('http_request_db_seconds', 'db', 'Time per request spent in the database.'),
+    ('http_request_serialization_seconds', 'serialization',
+     'Time per request spent rendering templates and encoding JSON.'),
+)
+
+
+'''
+RequestStats
+    what the current request has done so far, kept on flask.g
+'''
+
+
+class RequestStats(object):
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.serializing = False
+        self.status = 500
+        self.statements = Counter()
+
+
+def current_stats():
+    if not has_request_context():
+        return None
+    return g.get('_request_metrics')
+
+
+'''
+serializing()
+    counts the block as serialization time for the current request, less
+    the time its own queries took; nested blocks are only counted once
+'''
+
+
+@contextmanager
+def serializing():
+    stats = current_stats()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    started = time.perf_counter()
+    db_before = stats.db_seconds
+    try:
+        yield
+    finally:
+        stats.serializing = False
+        elapsed = time.perf_counter() - started
+        stats.serialization_seconds += max(0.0, elapsed - (stats.db_seconds - db_before))
+
+
+'''
+RequestMetrics
+    per-endpoint histograms and the gauges registered with register_stats,
+    rendered by GET /metrics
+'''
+
+
+class RequestMetrics(object):
+    def __init__(self, n_plus_one=None):
+        if n_plus_one is None:
+            n_plus_one = int(os.environ.get('METRICS_N_PLUS_ONE', 10))
+        self.n_plus_one = n_plus_one
+        self.endpoints = {}
+        self.requests = Counter()
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def register_stats(self, name, stats):
+        self.stats[name] = stats
+
+    def serializing(self):
+        return serializing()
+
+    def start(self):
+        g._request_metrics = RequestStats(self)
+
+    # a StatementTimer observer, statements outside a request are ignored
+    def record_statement(self, statement, seconds, executemany):
+        stats = current_stats()
+        if stats is None or stats.metrics is not self:
+            return
+        stats.queries += 1
+        stats.db_seconds += seconds
+        if not executemany:
+            stats.statements[statement] += 1
+
+    def finish(self, endpoint, method):
+        stats = g.pop('_request_metrics', None)
+        if stats is None or stats.metrics is not self:
+            return
+        duration = time.perf_counter() - stats.started
+        endpoint = endpoint or 'unmatched'
+        repeated = self.repeated_statements(stats)
+        if repeated:
+            statement, count = repeated
+            n_plus_one_log.warning(
+                'possible N+1 in %s: %d queries, one statement ran %d times: %s',
+                endpoint, stats.queries, count, ' '.join(statement.split())[:500]
+            )
+        with self._lock:
+            metrics = self.endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self.endpoints[endpoint] = EndpointMetrics()
+            metrics.duration.observe(duration)
+            metrics.queries.observe(stats.queries)
+            metrics.db.observe(stats.db_seconds)
+            metrics.serialization.observe(stats.serialization_seconds)
+            if repeated:
+                metrics.n_plus_one += 1
+            self.requests[(endpoint, method, stats.status)] += 1
+
+    def repeated_statements(self, stats):
+        if self.n_plus_one <= 0 or not stats.statements:
+            return None
+        statement, count = stats.statements.most_common(1)[0]
+        if count < self.n_plus_one:
+            return None
+        return statement, count
+
+    def gauges(self):
+        for name, stats in sorted(self.stats.items()):
+            for key, value in sorted(stats().items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                yield '{}_{}'.format(name, key), value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Requests handled.')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append('http_requests_total{{{}}} {}'.format(
+                    labels(endpoint=endpoint, method=method, status=status), count))
+            for name, attr, help in HISTOGRAMS:
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} histogram'.format(name))
+                for endpoint, metrics in sorted(self.endpoints.items()):
+                    lines.extend(getattr(metrics, attr).lines(name, endpoint=endpoint))
+            lines.append('# HELP http_request_n_plus_one_total Requests that repeated one statement METRICS_N_PLUS_ONE times or more.')
+            lines.append('# TYPE http_request_n_plus_one_total counter')
+            for endpoint, metrics in sorted(self.endpoints.items()):
+                lines.append('http_request_n_plus_one_total{{{}}} {}'.format(
+                    labels(endpoint=endpoint), metrics.n_plus_one))
+        for name, value in self.gauges():
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.append('{} {}'.format(name, number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def time_json(app):
+    provider = getattr(app, 'json', None)
+    if provider is not None and hasattr(provider, 'dumps'):
+        # flask >= 2.2, jsonify() goes through app.json.dumps
+        dumps = provider.dumps
+
+        def timed_dumps(obj, **kwargs):
+            with serializing():
+                return dumps(obj, **kwargs)
+
+        provider.dumps = timed_dumps
+        return
+
+    class TimedJSONEncoder(app.json_encoder):
+        def encode(self, o):
+            with serializing():
+                return super().encode(o)
+
+    app.json_encoder = TimedJSONEncoder
+
+
+def time_templates(app):
+    class TimedTemplate(app.jinja_env.template_class):
+        def render(self, *args, **kwargs):
+            with serializing():
+                return super().render(*args, **kwargs)
+
+    app.jinja_env.template_class = TimedTemplate
+
+
+'''
+instrument(app, db)
+    records every request of app and registers GET /metrics
+    call it after db_bootstrap.instrument(), whose StatementTimer feeds the
+    per-request query counts and whose pool metrics are exported as
+    db_pool_* gauges
+    the RequestMetrics is kept in app.extensions['request_metrics']
+'''
+
+
+def instrument(app, db=None):
+    metrics = RequestMetrics()
+    timer = app.extensions.get('db_statement_timer')
+    if timer is not None:
+        timer.observe(metrics.record_statement)
+    time_json(app)
+    time_templates(app)
+
+    pool_metrics = app.extensions.get('db_pool_metrics')
+    if pool_metrics is not None and db is not None:
+        metrics.register_stats(
+            'db_pool', lambda: pool_metrics.snapshot(db.get_engine(app).pool))
+
+    @app.before_request
+    def start_request_metrics():
+        metrics.start()
+
+    @app.after_request
+    def record_status(response):
+        stats = current_stats()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(error=None):
+        metrics.finish(request.endpoint, request.method)
+
+    '''
+    GET /metrics
+        the metrics above in the Prometheus text exposition format
+    returns 404 while METRICS_TOKEN is unset, 401 without the bearer token
+    '''
+    def metrics_view():
+        token = app.config.get('METRICS_TOKEN') or os.environ.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode('utf-8'), 'Bearer {}'.format(token).encode('utf-8')):
+            return Response('unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'},
+                            content_type='text/plain')
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.extensions['request_metrics'] = metrics
+    return metrics
@@ -0,0 +1,32 @@
+import json
+
+from flask import Response, stream_with_context
+
+STREAM_BATCH_SIZE = 500
+
+'''
+wants_stream(request)
+    true when the client opted in with ?stream=1 (or true/yes)
+'''
+def wants_stream(request):
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+'''
+stream_json(envelope, key, items)
+    streams {**envelope, key: [items...]} without building the list
+    items is any iterable of json-serializable objects, typically a
+    generator over a query using yield_per so only one batch of rows is
+    held in memory at a time
+'''
+def stream_json(envelope, key, items):
+    def generate():
+        head = json.dumps(envelope)[:-1]
+        if envelope:
+            head += ', '
+        yield head + json.dumps(key) + ': ['
+        separator = ''
+        for item in items:
+            yield separator + json.dumps(item)
+            separator = ', '
+        yield ']}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
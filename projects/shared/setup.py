@@ -0,0 +1,14 @@
+from setuptools import setup
+
+setup(
+    name='fsnd-shared',
+    version='0.1.0',
+    description='Database bootstrap and request metrics shared by the FSND Flask apps',
+    packages=['fsnd_shared'],
+    python_requires='>=3.6',
+    install_requires=[
+        'Flask',
+        'Flask-SQLAlchemy',
+        'SQLAlchemy',
+    ],
+)